@@ -0,0 +1,128 @@
+"""Server-authoritative battle deadlines.
+
+Active matches are kept in a heap ordered by their next wake-up time, and a
+single task sleeps until the earliest one, so idle matches cost nothing to
+poll and scheduling is O(log n) in the number of matches. Each wake-up
+either pushes a countdown tick (every ``tick_interval`` seconds, then every
+second during the final countdown) or, once the deadline has passed,
+expires the match. Times are Unix timestamps so deadlines can be recovered
+from ``matches.started_at`` after a restart.
+"""
+import asyncio
+import heapq
+import logging
+import math
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from observability import Gauge, registry
+
+logger = logging.getLogger(__name__)
+
+BATTLE_TICK_INTERVAL = float(os.getenv("BATTLE_TICK_INTERVAL", "30"))
+BATTLE_FINAL_COUNTDOWN = int(os.getenv("BATTLE_FINAL_COUNTDOWN", "10"))
+
+BATTLE_TIMERS = registry.register(Gauge(
+    "battle_timers_pending",
+    "Active matches with a scheduled deadline.",
+))
+
+
+class BattleTimer:
+    def __init__(self, on_expire: Callable[[str], Awaitable[None]],
+                 on_tick: Callable[[str, int], Awaitable[None]],
+                 tick_interval: float = BATTLE_TICK_INTERVAL, final_countdown: int = BATTLE_FINAL_COUNTDOWN,
+                 clock: Callable[[], float] = time.time):
+        self.on_expire = on_expire
+        self.on_tick = on_tick
+        self.tick_interval = tick_interval
+        self.final_countdown = final_countdown
+        self.clock = clock
+        # match_id -> (started_at, deadline)
+        self._matches: Dict[str, Tuple[float, float]] = {}
+        # Only the entry matching _wakes[match_id] is live, others were superseded
+        self._heap: List[Tuple[float, str]] = []
+        self._wakes: Dict[str, float] = {}
+        self._changed = asyncio.Event()
+        self._callbacks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._matches)
+
+    def schedule(self, match_id: str, started_at: float, time_limit: float):
+        deadline = started_at + time_limit
+        self._matches[match_id] = (started_at, deadline)
+        self._push(match_id, self._next_wake(deadline, self.clock()))
+        BATTLE_TIMERS.set(len(self._matches))
+
+    def cancel(self, match_id: str):
+        self._matches.pop(match_id, None)
+        self._wakes.pop(match_id, None)
+        # Superseded entries are skipped when popped; rebuild if they pile up
+        if len(self._heap) > 2 * len(self._wakes) + 64:
+            self._heap = [(when, m) for m, when in self._wakes.items()]
+            heapq.heapify(self._heap)
+        BATTLE_TIMERS.set(len(self._matches))
+
+    def elapsed(self, match_id: str) -> Optional[float]:
+        """Seconds since the match started, None if it isn't scheduled here"""
+        entry = self._matches.get(match_id)
+        return self.clock() - entry[0] if entry else None
+
+    def remaining(self, match_id: str) -> Optional[float]:
+        entry = self._matches.get(match_id)
+        return max(0.0, entry[1] - self.clock()) if entry else None
+
+    def _push(self, match_id: str, when: float):
+        self._wakes[match_id] = when
+        heapq.heappush(self._heap, (when, match_id))
+        if self._heap[0][1] == match_id:
+            # New earliest wake-up, interrupt the current sleep
+            self._changed.set()
+
+    def _next_wake(self, deadline: float, now: float) -> float:
+        """Time of the next countdown tick, or the deadline itself"""
+        remaining = deadline - now
+        step = 1 if remaining <= self.final_countdown else self.tick_interval
+        # Largest multiple of step strictly below the remaining time
+        tick = max(0, math.ceil(remaining / step - 1) * step)
+        if remaining > self.final_countdown:
+            tick = max(tick, self.final_countdown)
+        return deadline - tick
+
+    def fire_due(self):
+        """Start the callbacks of every tick and expiry that is due"""
+        now = self.clock()
+        while self._heap and self._heap[0][0] <= now:
+            when, match_id = heapq.heappop(self._heap)
+            if self._wakes.get(match_id) != when:
+                continue
+            deadline = self._matches[match_id][1]
+            if when >= deadline:
+                self.cancel(match_id)
+                self._spawn(self.on_expire(match_id))
+            else:
+                self._spawn(self.on_tick(match_id, round(deadline - when)))
+                self._push(match_id, self._next_wake(deadline, when))
+
+    async def run(self):
+        """Fire ticks and expiries until cancelled"""
+        while True:
+            self.fire_due()
+            self._changed.clear()
+            timeout = self._heap[0][0] - self.clock() if self._heap else None
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _spawn(self, coro: Awaitable[None]):
+        task = asyncio.ensure_future(coro)
+        self._callbacks.add(task)
+        task.add_done_callback(self._callback_done)
+
+    def _callback_done(self, task: asyncio.Task):
+        self._callbacks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Battle timer callback failed: {task.exception()}")
@@ -0,0 +1,394 @@
+"""In-process fakes for Supabase (PostgREST + GoTrue) and the OpenAI API.
+
+The fakes implement just enough of each wire protocol for the queries that
+``main.py`` issues, backed by in-memory tables, with a configurable latency
+per call so benchmarks can model a remote database and a slow LLM.
+"""
+import asyncio
+import json
+import random
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+# Column defaults mirroring supabase/migrations for the tables the API touches
+TABLE_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    "profiles": {
+        "avatar": "🚀", "level": 1, "xp": 0, "total_xp": 0, "streak_days": 0,
+        "last_activity_date": None, "mood": "excited", "rank": "Bronze I", "total_battles": 0, "battles_won": 0,
+        "quests_completed": 0, "cards_collected": 0, "contributions_accepted": 0,
+    },
+    "matches": {
+        "status": "waiting", "mode": "quick", "max_players": 2, "time_limit": 1800,
+        "xp_wager": 100, "test_cases": [], "starter_code": "", "solution": "",
+        "started_at": None, "ended_at": None, "winner_id": None, "stats_recorded": False,
+    },
+    "match_participants": {
+        "code_submission": None, "score": 0, "completion_time": None, "tests_passed": 0,
+        "total_tests": 0, "rank": None, "submitted_at": None, "similarity_score": None, "similar_to": None,
+    },
+    "xp_logs": {"description": None, "idempotency_key": None},
+    "flashcards": {"rarity": "common", "xp_value": 25, "times_played": 0, "correct_answers": 0, "tags": []},
+    "user_flashcards": {"owned": False, "times_played": 0, "correct_answers": 0, "average_response_time": 0},
+    "submissions": {"status": "pending", "live_url": None, "xp_reward": 0, "tags": []},
+    "diy_tasks": {"status": "generated", "estimated_time": "2-3 hours", "xp_reward": 500},
+    "daily_goals": {"current": 0, "completed": False, "icon": "🎯", "completed_at": None},
+    "chat_messages": {"mood": None, "context": {}},
+    "mood_logs": {"intensity": 5, "context": None, "triggers": [], "activities": [], "productivity_score": 50,
+                  "engagement_score": 50, "session_duration": 0},
+}
+
+# Tables whose updated_at is set by the update_updated_at_column() trigger
+UPDATED_AT_TABLES = {"profiles", "concept_progress", "submissions"}
+
+FILTER_OPERATORS = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt": lambda a, b: _ordered(a) > _ordered(b),
+    "gte": lambda a, b: _ordered(a) >= _ordered(b),
+    "lt": lambda a, b: _ordered(a) < _ordered(b),
+    "lte": lambda a, b: _ordered(a) <= _ordered(b),
+}
+
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _timestamp(value: str) -> datetime:
+    """A stored timestamp as an aware datetime, naive values being UTC like timestamptz input"""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+
+def _as_param(value: Any) -> str:
+    """Render a stored value the way PostgREST filters compare it"""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _ordered(value: str):
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def _split_top_level(text: str) -> List[str]:
+    """Split a select list on commas that are not inside parentheses"""
+    parts, depth, current = [], 0, []
+    for char in text:
+        if char == "," and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        depth += char == "("
+        depth -= char == ")"
+        current.append(char)
+    if current:
+        parts.append("".join(current).strip())
+    return [p for p in parts if p]
+
+
+class FakeSupabase:
+    """Starlette app serving ``/rest/v1``, ``/auth/v1`` and ``/v1/chat/completions``.
+
+    Bearer tokens are accepted as-is and the token value is used as the user
+    id, so benchmark clients authenticate as ``Authorization: Bearer <user_id>``.
+    """
+
+    def __init__(self, db_latency_ms: float = 5.0, llm_latency_ms: float = 400.0,
+                 jitter: float = 0.2, seed: int = 0):
+        self.db_latency_ms = db_latency_ms
+        self.llm_latency_ms = llm_latency_ms
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.calls: Dict[str, int] = {}
+        self.app = Starlette(routes=[
+            Route("/auth/v1/user", self.get_user, methods=["GET"]),
+            Route("/rest/v1/rpc/{function}", self.rpc, methods=["POST"]),
+            Route("/rest/v1/{table}", self.rest, methods=["GET", "POST", "PATCH", "DELETE"]),
+            Route("/v1/chat/completions", self.chat_completions, methods=["POST"]),
+        ])
+
+    # Seeding
+
+    def insert_rows(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        stored = []
+        for row in rows:
+            record = {"id": str(uuid.uuid4()), "created_at": _now()}
+            if table in UPDATED_AT_TABLES:
+                record["updated_at"] = record["created_at"]
+            record.update(TABLE_DEFAULTS.get(table, {}))
+            record.update(row)
+            self.tables.setdefault(table, []).append(record)
+            stored.append(record)
+        return stored
+
+    def seed(self, users: int = 200, flashcards: int = 60, submissions: int = 200) -> List[str]:
+        """Populate realistic baseline data and return the created user ids"""
+        user_ids = [str(uuid.uuid4()) for _ in range(users)]
+        self.insert_rows("profiles", [
+            {"id": uid, "username": f"pilot_{i}", "xp": self.random.randint(0, 900),
+             "total_xp": self.random.randint(0, 50000), "level": self.random.randint(1, 50)}
+            for i, uid in enumerate(user_ids)
+        ])
+        categories = ["algorithms", "python", "javascript", "databases", "networking"]
+        self.insert_rows("flashcards", [
+            {"question": f"Question {i}: what does this snippet return?", "answer": f"Answer {i}",
+             "category": categories[i % len(categories)], "difficulty": ["easy", "medium", "hard"][i % 3]}
+            for i in range(flashcards)
+        ])
+        self.insert_rows("matches", [
+            {"creator_id": user_ids[0], "problem_title": f"Template {i}", "status": "template",
+             "problem_description": "Return the sum of a list of integers.", "difficulty": "easy",
+             "test_cases": [{"input": "[1, 2, 3]", "output": "6"}, {"input": "[]", "output": "0"}],
+             "starter_code": "def solve(nums):\n    pass\n"}
+            for i in range(5)
+        ])
+        tags = ["react", "python", "fastapi", "ml", "games", "cli", "web", "api"]
+        self.insert_rows("submissions", [
+            {"title": f"Project {i}", "description": f"A {tags[i % len(tags)]} project number {i}",
+             "author_id": user_ids[i % users], "type": "feature", "code_url": f"https://example.com/{i}",
+             "tags": self.random.sample(tags, 2)}
+            for i in range(submissions)
+        ])
+        return user_ids
+
+    # Latency model
+
+    async def _delay(self, base_ms: float):
+        if base_ms <= 0:
+            return
+        spread = base_ms * self.jitter
+        await asyncio.sleep(max(0.0, self.random.uniform(base_ms - spread, base_ms + spread)) / 1000)
+
+    def _count(self, key: str):
+        self.calls[key] = self.calls.get(key, 0) + 1
+
+    # GoTrue
+
+    async def get_user(self, request: Request):
+        self._count("auth.get_user")
+        await self._delay(self.db_latency_ms)
+        token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not token:
+            return JSONResponse({"msg": "missing token"}, status_code=401)
+        return JSONResponse({
+            "id": token, "aud": "authenticated", "role": "authenticated",
+            "email": f"{token}@bench.local", "app_metadata": {}, "user_metadata": {},
+            "created_at": "2025-01-01T00:00:00+00:00",
+        })
+
+    # PostgREST
+
+    def _filters(self, request: Request) -> List[Tuple[str, str, str]]:
+        filters = []
+        for key, value in request.query_params.multi_items():
+            if key in RESERVED_PARAMS or "." in key:
+                continue
+            operator, _, operand = value.partition(".")
+            filters.append((key, operator, operand))
+        return filters
+
+    @staticmethod
+    def _matches(row: Dict[str, Any], filters: List[Tuple[str, str, str]]) -> bool:
+        for column, operator, operand in filters:
+            value = _as_param(row.get(column))
+            if isinstance(row.get(column), bool):
+                # Postgres booleans parse case-insensitively ("False" from Python values)
+                operand = operand.lower()
+            if operator == "in":
+                if value not in operand.strip("()").split(","):
+                    return False
+            elif operator == "is":
+                if value != operand:
+                    return False
+            elif not FILTER_OPERATORS[operator](value, operand):
+                return False
+        return True
+
+    def _project(self, row: Dict[str, Any], select: str) -> Dict[str, Any]:
+        columns = _split_top_level(select or "*")
+        result: Dict[str, Any] = {}
+        for column in columns:
+            if "(" in column:
+                # Embedded resource, e.g. profiles!creator_id(username, avatar)
+                relation, _, inner = column.partition("(")
+                inner = inner.rstrip(")")
+                alias, _, relation = relation.rpartition(":")
+                table, _, foreign_key = relation.partition("!")
+                target = next((r for r in self.tables.get(table, []) if r["id"] == row.get(foreign_key)), None)
+                result[alias or table] = self._project(target, inner) if target else None
+            elif column == "*":
+                result.update(row)
+            else:
+                result[column] = row.get(column)
+        return result
+
+    @staticmethod
+    def _order(rows: List[Dict[str, Any]], order: Optional[str]) -> List[Dict[str, Any]]:
+        if not order:
+            return rows
+        for term in reversed(order.split(",")):
+            column, _, direction = term.partition(".")
+            rows = sorted(rows, key=lambda r: (r.get(column) is None, r.get(column) or 0),
+                          reverse=direction.startswith("desc"))
+        return rows
+
+    async def rest(self, request: Request):
+        table = request.path_params["table"]
+        self._count(f"{request.method} {table}")
+        await self._delay(self.db_latency_ms)
+
+        rows = self.tables.setdefault(table, [])
+        params = request.query_params
+        filters = self._filters(request)
+
+        total = None
+        if request.method == "POST":
+            body = await request.json()
+            affected = self.insert_rows(table, body if isinstance(body, list) else [body])
+            status_code = 201
+        elif request.method == "PATCH":
+            changes = await request.json()
+            affected = [row for row in rows if self._matches(row, filters)]
+            for row in affected:
+                row.update(changes)
+                if table in UPDATED_AT_TABLES:
+                    row["updated_at"] = _now()
+            status_code = 200
+        elif request.method == "DELETE":
+            affected = [row for row in rows if self._matches(row, filters)]
+            self.tables[table] = [row for row in rows if row not in affected]
+            if table == "submissions":
+                # The record_submission_deletion() trigger
+                self.insert_rows("submission_deletions", [{"id": row["id"], "deleted_at": _now()} for row in affected])
+            status_code = 200
+        else:
+            affected = self._order([row for row in rows if self._matches(row, filters)], params.get("order"))
+            total = len(affected)
+            offset = int(params.get("offset", 0))
+            limit = params.get("limit")
+            affected = affected[offset:offset + int(limit)] if limit else affected[offset:]
+            status_code = 200
+
+        data = [self._project(row, params.get("select", "*")) for row in affected]
+
+        if "vnd.pgrst.object+json" in request.headers.get("accept", ""):
+            if len(data) != 1:
+                return JSONResponse({
+                    "code": "PGRST116",
+                    "details": f"Results contain {len(data)} rows",
+                    "hint": None,
+                    "message": "JSON object requested, multiple (or no) rows returned",
+                }, status_code=406)
+            return JSONResponse(data[0], status_code=status_code)
+
+        prefer = request.headers.get("prefer", "")
+        if "return=minimal" in prefer:
+            return Response(status_code=204)
+        headers = {}
+        if "count=exact" in prefer:
+            headers["content-range"] = f"0-{max(0, len(data) - 1)}/{len(data) if total is None else total}"
+        return JSONResponse(data, status_code=status_code, headers=headers)
+
+    # Database functions from supabase/migrations
+
+    async def rpc(self, request: Request):
+        function = request.path_params["function"]
+        self._count(f"RPC {function}")
+        await self._delay(self.db_latency_ms)
+        handler = getattr(self, f"_rpc_{function}", None)
+        if handler is None:
+            return JSONResponse({"code": "PGRST202", "message": f"Could not find the function {function}"},
+                                status_code=404)
+        try:
+            return JSONResponse(handler(**await request.json()))
+        except LookupError as e:
+            # RAISE EXCEPTION in a function surfaces as a P0001 error
+            return JSONResponse({"code": "P0001", "message": str(e)}, status_code=400)
+
+    def _rpc_increment_goal_progress(self, goal_ids: List[str], amounts: List[int]) -> List[Dict[str, Any]]:
+        increments = dict(zip(goal_ids, amounts))
+        updated = []
+        for goal in self.tables.get("daily_goals", []):
+            if goal["id"] in increments and not goal["completed"]:
+                goal["current"] = min(goal["target"], goal["current"] + increments[goal["id"]])
+                updated.append(goal)
+        return updated
+
+    def _rpc_award_xp(self, user_id: str, amount: int, source: str, description: Optional[str] = None,
+                      idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        profile = next((p for p in self.tables.get("profiles", []) if p["id"] == user_id), None)
+        if profile is None:
+            raise LookupError(f"Profile {user_id} not found")
+        log = None
+        if idempotency_key is None or not any(
+                row["idempotency_key"] == idempotency_key for row in self.tables.get("xp_logs", [])):
+            log = self.insert_rows("xp_logs", [{"user_id": user_id, "amount": amount, "source": source,
+                                                "description": description, "idempotency_key": idempotency_key}])[0]
+            profile["xp"] += amount
+            profile["total_xp"] += amount
+            profile["level"] = max(1, profile["total_xp"] // 1000 + 1)
+        return {"applied": log is not None, "log": log, "xp": profile["xp"], "total_xp": profile["total_xp"],
+                "level": profile["level"]}
+
+    def _rpc_record_battle_win(self, match_id: str, user_id: str) -> bool:
+        match = next((m for m in self.tables.get("matches", []) if m["id"] == match_id), None)
+        if match is None or match["stats_recorded"]:
+            return False
+        match["stats_recorded"] = True
+        for profile in self.tables.get("profiles", []):
+            if profile["id"] == user_id:
+                profile["total_battles"] += 1
+                profile["battles_won"] += 1
+        return True
+
+    def _rpc_problem_submissions(self, title: str, since: Optional[str] = None) -> List[Dict[str, Any]]:
+        match_ids = {m["id"] for m in self.tables.get("matches", []) if m.get("problem_title") == title}
+        rows = [
+            {key: row[key] for key in ("id", "user_id", "code_submission", "submitted_at")}
+            for row in self.tables.get("match_participants", [])
+            if row["match_id"] in match_ids and row["code_submission"] and row["submitted_at"]
+            and (since is None or _timestamp(row["submitted_at"]) >= _timestamp(since))
+        ]
+        return sorted(rows, key=lambda row: _timestamp(row["submitted_at"]))
+
+    # OpenAI
+
+    async def chat_completions(self, request: Request):
+        self._count("openai.chat")
+        body = await request.json()
+        await self._delay(self.llm_latency_ms)
+        prompt = " ".join(m.get("content", "") for m in body.get("messages", []))
+        if "Return a JSON object" in prompt:
+            content = json.dumps({
+                "title": "Benchmark Project",
+                "description": "A generated practice project.",
+                "features": ["Feature one", "Feature two", "Feature three", "Feature four"],
+                "challenges": ["Challenge one", "Challenge two", "Challenge three"],
+                "files": [{"name": "src/App.tsx", "type": "component", "lines": 120}],
+            })
+        else:
+            content = "Let's break this problem down step by step. " * 4
+        return JSONResponse({
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(datetime.now(timezone.utc).timestamp()),
+            "model": body.get("model", "gpt-4"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (len(prompt) + len(content)) // 4},
+        })
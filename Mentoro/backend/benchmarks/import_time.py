@@ -0,0 +1,71 @@
+"""Measure how long ``import main`` takes and enforce an import-time budget.
+
+Each sample runs ``python -X importtime -c "import main"`` in a fresh
+interpreter with the Supabase and OpenAI settings removed, which also checks
+that the app can be imported by tooling without credentials.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.import_time --budget-ms 800
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Optional, Tuple
+
+CREDENTIAL_VARS = ("SUPABASE_URL", "SUPABASE_ANON_KEY", "OPENAI_API_KEY", "OPENAI_BASE_URL")
+
+
+def sample(backend_dir: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """Return the cumulative import time of ``main`` and of its direct imports, in ms"""
+    env = {k: v for k, v in os.environ.items() if k not in CREDENTIAL_VARS}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=backend_dir, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing main failed:\n{proc.stderr}")
+
+    # Lines are "import time: self | cumulative | <indent>name", children first
+    entries: List[Tuple[int, str, float]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        entries.append((len(name) - len(name.lstrip()), name.strip(), int(cumulative) / 1000))
+
+    main_index = max(i for i, (_, name, _) in enumerate(entries) if name == "main")
+    main_indent, _, total = entries[main_index]
+    children = []
+    for indent, name, ms in reversed(entries[:main_index]):
+        if indent <= main_indent:
+            break
+        if indent == main_indent + 2:
+            children.append((name, ms))
+    return total, children
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=800, help="fail if importing main takes longer")
+    parser.add_argument("--samples", type=int, default=5, help="fresh interpreters to run; the fastest counts")
+    parser.add_argument("--top", type=int, default=10, help="slowest direct imports of main to list")
+    args = parser.parse_args(argv)
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # The first run may also compile bytecode, so keep the fastest sample
+    best_total, children = min((sample(backend_dir) for _ in range(args.samples)), key=lambda s: s[0])
+
+    print(f"import main: {best_total:.1f}ms (budget {args.budget_ms:.0f}ms, best of {args.samples})")
+    for name, ms in sorted(children, key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<30}{ms:>9.1f}ms")
+
+    if best_total > args.budget_ms:
+        print("Import-time budget exceeded")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+"""Load and latency benchmark for the FastAPI backend.
+
+Boots ``main.app`` in-process against the fakes in ``benchmarks.fakes`` and
+drives a mixed workload from concurrent virtual users, then reports
+p50/p95/p99 latency and throughput per endpoint.
+
+Usage (from the backend directory):
+
+    python -m benchmarks.run --duration 30 --users 50
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --baseline results.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+import websockets
+
+from benchmarks.fakes import FakeSupabase
+
+# Relative weights of each scenario in the mixed workload
+SCENARIO_WEIGHTS = {
+    "flashcard_drill": 30,
+    "leaderboard_poll": 25,
+    "dashboard": 10,
+    "battle": 15,
+    "buddy_chat": 10,
+    "diy_generate": 5,
+    "diy_generate_background": 5,
+    "websocket_room": 15,
+}
+
+# A JWT-shaped placeholder; the client only validates the format
+FAKE_ANON_KEY = "bench.anon.key"
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve_in_thread(app, port: int) -> Tuple[uvicorn.Server, threading.Thread]:
+    """Run an ASGI app on its own event loop so a blocking app can't stall the fakes"""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Server on port {port} failed to start")
+        time.sleep(0.01)
+    return server, thread
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, endpoint: str, seconds: float, ok: bool = True):
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, elapsed: float) -> Dict[str, Dict[str, float]]:
+        results = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            results[endpoint] = {
+                "count": len(values),
+                "errors": self.errors.get(endpoint, 0),
+                "throughput_rps": round(len(values) / elapsed, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+            }
+        return results
+
+
+class VirtualUser:
+    """One simulated client looping over weighted scenarios"""
+
+    def __init__(self, index: int, user_ids: List[str], api_url: str, ws_url: str,
+                 recorder: Recorder, seed: int):
+        self.rng = random.Random(seed + index)
+        self.user_id = user_ids[index % len(user_ids)]
+        # Battles and WebSocket rooms need an opponent
+        self.opponent_id = user_ids[(index + len(user_ids) // 2) % len(user_ids)]
+        self.ws_url = ws_url
+        self.recorder = recorder
+        self.client = httpx.AsyncClient(base_url=api_url, timeout=60)
+        self.card_ids: List[str] = []
+
+    async def request(self, endpoint: str, method: str, path: str, user_id: Optional[str] = None, **kwargs):
+        headers = {"Authorization": f"Bearer {user_id or self.user_id}"}
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers=headers, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.recorder.record(endpoint, time.perf_counter() - start, ok)
+        return response if ok else None
+
+    async def run(self, deadline: float):
+        names = list(SCENARIO_WEIGHTS)
+        weights = [SCENARIO_WEIGHTS[name] for name in names]
+        try:
+            while time.perf_counter() < deadline:
+                scenario = self.rng.choices(names, weights)[0]
+                await getattr(self, scenario)()
+        finally:
+            await self.client.aclose()
+
+    async def flashcard_drill(self):
+        if not self.card_ids:
+            response = await self.request("GET /api/flashcards", "GET", "/api/flashcards")
+            if response is None:
+                return
+            self.card_ids = [card["id"] for card in response.json()["cards"]]
+        for card_id in self.rng.sample(self.card_ids, min(5, len(self.card_ids))):
+            await self.request(
+                "POST /api/flashcards/{card_id}/play", "POST", f"/api/flashcards/{card_id}/play",
+                params={"correct": self.rng.random() < 0.7, "response_time": round(self.rng.uniform(1, 10), 2)},
+            )
+
+    async def leaderboard_poll(self):
+        await self.request("GET /api/leaderboard", "GET", "/api/leaderboard")
+        await self.request("GET /api/battles/active", "GET", "/api/battles/active")
+        await self.request("GET /api/submissions", "GET", "/api/submissions")
+
+    async def dashboard(self):
+        await self.request("GET /api/me/summary", "GET", "/api/me/summary")
+
+    async def battle(self):
+        response = await self.request("POST /api/battles/create", "POST", "/api/battles/create",
+                                      json={"difficulty": "easy", "xp_wager": 100})
+        if response is None:
+            return
+        match_id = response.json()["match_id"]
+        if await self.request("POST /api/battles/{match_id}/join", "POST", f"/api/battles/{match_id}/join",
+                              user_id=self.opponent_id) is None:
+            return
+        for user_id in (self.user_id, self.opponent_id):
+            await self.request("POST /api/battles/{match_id}/submit", "POST", f"/api/battles/{match_id}/submit",
+                               user_id=user_id, json={"code": "def solve(nums):\n    return sum(nums)\n"})
+
+    async def buddy_chat(self):
+        await self.request("POST /api/buddy/chat", "POST", "/api/buddy/chat",
+                           json={"content": "How do I reverse a linked list?", "personality": "ada"})
+
+    async def diy_generate(self):
+        await self.request("POST /api/diy/generate", "POST", "/api/diy/generate",
+                           json={"topic": "React", "level": "beginner", "technologies": ["react", "vite"]})
+
+    async def diy_generate_background(self):
+        """Queue a DIY task as a job and poll until it finishes"""
+        start = time.perf_counter()
+        response = await self.request("POST /api/diy/generate?background", "POST", "/api/diy/generate",
+                                      params={"background": True},
+                                      json={"topic": "React", "level": "beginner", "technologies": ["react", "vite"]})
+        if response is None:
+            return
+        job_id = response.json()["id"]
+        while True:
+            await asyncio.sleep(0.1)
+            response = await self.request("GET /api/jobs/{job_id}", "GET", f"/api/jobs/{job_id}")
+            if response is None or response.json()["status"] in ("succeeded", "failed"):
+                break
+        ok = response is not None and response.json()["status"] == "succeeded"
+        self.recorder.record("DIY job completion", time.perf_counter() - start, ok)
+
+    async def websocket_room(self):
+        """Two members join a room and measure code_sync broadcast round trips"""
+        match_id = f"bench-room-{self.user_id}"
+        start = time.perf_counter()
+        try:
+            async with websockets.connect(f"{self.ws_url}/ws/{self.user_id}") as sender, \
+                    websockets.connect(f"{self.ws_url}/ws/{self.opponent_id}") as receiver:
+                self.recorder.record("WS connect", time.perf_counter() - start)
+                for ws in (sender, receiver):
+                    await ws.send(json.dumps({"type": "join_match", "match_id": match_id}))
+                    await asyncio.wait_for(self._wait_for(ws, "joined_match"), timeout=10)
+                code = "def solve(nums):\n    return sum(nums)\n" * 20
+                for cursor in range(5):
+                    sent = time.perf_counter()
+                    await sender.send(json.dumps({"type": "code_update", "match_id": match_id,
+                                                  "code": code, "cursor": cursor}))
+                    await asyncio.wait_for(self._wait_for(receiver, "code_sync"), timeout=10)
+                    self.recorder.record("WS code_sync broadcast", time.perf_counter() - sent)
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+            self.recorder.record("WS code_sync broadcast", time.perf_counter() - start, ok=False)
+
+    @staticmethod
+    async def _wait_for(ws, message_type: str):
+        while True:
+            message = json.loads(await ws.recv())
+            if message.get("type") == message_type:
+                return message
+
+
+async def drive(user_ids: List[str], api_url: str, ws_url: str, users: int, duration: float, seed: int):
+    recorder = Recorder()
+    vus = [VirtualUser(i, user_ids, api_url, ws_url, recorder, seed) for i in range(users)]
+    start = time.perf_counter()
+    await asyncio.gather(*(vu.run(start + duration) for vu in vus))
+    return recorder.report(time.perf_counter() - start)
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            max_regression: float) -> List[str]:
+    """Endpoints whose p95 regressed by more than ``max_regression`` (a fraction)"""
+    regressions = []
+    for endpoint, stats in results.items():
+        before = baseline.get(endpoint)
+        if not before or not before["p95_ms"]:
+            continue
+        change = stats["p95_ms"] / before["p95_ms"] - 1
+        if change > max_regression:
+            regressions.append(f"{endpoint}: p95 {before['p95_ms']}ms -> {stats['p95_ms']}ms (+{change:.0%})")
+    return regressions
+
+
+def print_report(results: Dict[str, Dict[str, float]]):
+    header = f"{'endpoint':<42}{'count':>8}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for endpoint, stats in results.items():
+        print(f"{endpoint:<42}{stats['count']:>8}{stats['errors']:>8}{stats['throughput_rps']:>9}"
+              f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20, help="seconds to run the workload")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--db-latency-ms", type=float, default=5, help="latency of each fake Supabase call")
+    parser.add_argument("--llm-latency-ms", type=float, default=400, help="latency of each fake OpenAI call")
+    parser.add_argument("--rate-limits", default="llm=0,xp=0,write=0",
+                        help="RATE_LIMITS for the backend; disabled by default so limits don't skew latency")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="allowed p95 increase over the baseline before failing (fraction)")
+    args = parser.parse_args(argv)
+
+    fake = FakeSupabase(db_latency_ms=args.db_latency_ms, llm_latency_ms=args.llm_latency_ms, seed=args.seed)
+    user_ids = fake.seed()
+    fake_port = _serve_in_thread(fake.app, _free_port())[0].config.port
+
+    # The backend reads its configuration at import time
+    state_dir = tempfile.mkdtemp(prefix="mentoro-bench-")
+    os.environ.update({
+        "SUPABASE_URL": f"http://127.0.0.1:{fake_port}",
+        "SUPABASE_ANON_KEY": FAKE_ANON_KEY,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "RATE_LIMITS": args.rate_limits,
+        "JOBS_DB_PATH": os.path.join(state_dir, "jobs.sqlite3"),
+        "SEARCH_SNAPSHOT_PATH": os.path.join(state_dir, "search_snapshot.json"),
+    })
+    import main as backend
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    api, api_thread = _serve_in_thread(backend.app, _free_port())
+    api_port = api.config.port
+    results = asyncio.run(drive(user_ids, f"http://127.0.0.1:{api_port}", f"ws://127.0.0.1:{api_port}",
+                                args.users, args.duration, args.seed))
+    # Shut the backend down, so its lifespan stops the job workers before the interpreter exits
+    api.should_exit = True
+    api_thread.join(timeout=10)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print("\nRegressions over baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
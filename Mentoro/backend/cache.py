@@ -0,0 +1,126 @@
+"""Request coalescing and micro-TTL caching for hot read paths.
+
+Concurrent callers asking for the same key share a single in-flight load
+(single-flight). Results are kept for a short TTL, and for a further
+``stale_ttl`` they are still served immediately while one background load
+refreshes them (stale-while-revalidate).
+"""
+import asyncio
+import functools
+import inspect
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from observability import Counter, registry
+
+logger = logging.getLogger(__name__)
+
+CACHE_REQUESTS = registry.register(Counter(
+    "read_cache_requests_total",
+    "Read cache lookups by outcome (hit, stale, coalesced, miss).",
+    ("cache", "result"),
+))
+
+
+class ReadCache:
+    def __init__(self, name: str, ttl: float, stale_ttl: float = 0.0, max_entries: int = 1024):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        # A load only stores its result while it is still the registered load for
+        # its key, so invalidate() dropping it discards results started earlier
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, loaded_at = entry
+            age = time.monotonic() - loaded_at
+            if age < self.ttl:
+                CACHE_REQUESTS.inc(self.name, "hit")
+                return value
+            if age < self.ttl + self.stale_ttl:
+                CACHE_REQUESTS.inc(self.name, "stale")
+                if key not in self._inflight:
+                    self._start_load(key, loader).add_done_callback(self._log_refresh_error)
+                return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            CACHE_REQUESTS.inc(self.name, "coalesced")
+        else:
+            CACHE_REQUESTS.inc(self.name, "miss")
+            inflight = self._start_load(key, loader)
+        # Shield so one cancelled waiter doesn't cancel the load for everyone else
+        return await asyncio.shield(inflight)
+
+    def _start_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        task = asyncio.ensure_future(self._load(key, loader))
+        self._inflight[key] = task
+        return task
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await loader()
+            if self._inflight.get(key) is asyncio.current_task():
+                self._entries[key] = (value, time.monotonic())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return value
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    def _log_refresh_error(self, task: asyncio.Future):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background refresh of {self.name} failed, serving stale data: {task.exception()}")
+
+    def update(self, key: Hashable, func: Callable[[Any], Any]):
+        """Replace a cached value with ``func(value)``, keeping its age.
+
+        Keys that aren't cached are left alone, and keys with a load in flight
+        are dropped instead since that load may not include the change.
+        """
+        if key in self._inflight:
+            self.invalidate(key)
+            return
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries[key] = (func(entry[0]), entry[1])
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Drop one key, or every key when none is given"""
+        if key is None:
+            self._entries.clear()
+            self._inflight.clear()
+        else:
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
+
+
+def cached_read(ttl: float, stale_ttl: float = 0.0, max_entries: int = 1024):
+    """Coalesce and cache a read helper, keyed by its arguments.
+
+    Synchronous helpers (such as direct Supabase queries) run in a worker
+    thread so that concurrent callers can actually wait on the same load.
+    The wrapped function exposes ``.cache`` for invalidation.
+    """
+    def decorator(func):
+        cache = ReadCache(func.__name__, ttl, stale_ttl, max_entries)
+        is_async = inspect.iscoroutinefunction(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            if is_async:
+                return await cache.get(key, lambda: func(*args, **kwargs))
+            return await cache.get(key, lambda: asyncio.to_thread(func, *args, **kwargs))
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -0,0 +1,225 @@
+"""WebSocket connection and match room bookkeeping.
+
+A user may be connected from several devices at once; messages for a user
+go to all of their connections. A heartbeat loop pings every connection,
+closes the ones that have gone quiet for longer than the idle timeout, and
+drops room members that stayed offline past a grace period, so the
+bookkeeping stays bounded however long a worker runs. Rooms are torn down
+explicitly when their match completes.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import time
+from typing import Any, Dict, List, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+import ws_codec
+from observability import Gauge, registry, span
+
+logger = logging.getLogger(__name__)
+
+WS_HEARTBEAT_INTERVAL = float(os.getenv("WS_HEARTBEAT_INTERVAL", "20"))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "60"))
+WS_ROOM_GRACE = float(os.getenv("WS_ROOM_GRACE", "120"))
+WS_MAX_CONNECTIONS_PER_USER = int(os.getenv("WS_MAX_CONNECTIONS_PER_USER", "5"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+
+# Close codes from the application range (4000-4999)
+CLOSE_IDLE = 4000
+CLOSE_REPLACED = 4001
+
+WS_CONNECTIONS = registry.register(Gauge(
+    "websocket_connections",
+    "Open WebSocket connections.",
+))
+WS_CONNECTED_USERS = registry.register(Gauge(
+    "websocket_connected_users",
+    "Users with at least one open WebSocket connection.",
+))
+WS_MATCH_ROOMS = registry.register(Gauge(
+    "websocket_match_rooms",
+    "Match rooms with at least one member.",
+))
+
+
+class Connection:
+    __slots__ = ("id", "user_id", "websocket", "codec", "last_seen")
+
+    def __init__(self, connection_id: int, user_id: str, websocket: WebSocket, codec):
+        self.id = connection_id
+        self.user_id = user_id
+        self.websocket = websocket
+        self.codec = codec
+        self.last_seen = time.monotonic()
+
+
+class ConnectionManager:
+    def __init__(self, heartbeat_interval: float = WS_HEARTBEAT_INTERVAL, idle_timeout: float = WS_IDLE_TIMEOUT,
+                 room_grace: float = WS_ROOM_GRACE, max_connections_per_user: int = WS_MAX_CONNECTIONS_PER_USER,
+                 send_timeout: float = WS_SEND_TIMEOUT):
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.room_grace = room_grace
+        self.max_connections_per_user = max_connections_per_user
+        self.send_timeout = send_timeout
+        # user_id -> connection id -> connection, oldest first
+        self.active_connections: Dict[str, Dict[int, Connection]] = {}
+        self.match_rooms: Dict[str, Set[str]] = {}
+        self.user_rooms: Dict[str, Set[str]] = {}
+        # Room members with no open connection, and since when
+        self.offline_since: Dict[str, float] = {}
+        self.connection_count = 0
+        self._ids = itertools.count(1)
+
+    async def connect(self, websocket: WebSocket, user_id: str) -> Connection:
+        # The encoding is negotiated through the subprotocols the client offers
+        subprotocol = ws_codec.negotiate(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=subprotocol)
+        connection = Connection(next(self._ids), user_id, websocket, ws_codec.codec_for(subprotocol))
+
+        connections = self.active_connections.setdefault(user_id, {})
+        connections[connection.id] = connection
+        self.connection_count += 1
+        self.offline_since.pop(user_id, None)
+        while len(connections) > self.max_connections_per_user:
+            oldest = next(iter(connections.values()))
+            self.disconnect(oldest)
+            await self._close(oldest, CLOSE_REPLACED)
+
+        logger.info(f"User {user_id} connected ({connection.codec.name}, {len(connections)} device(s))")
+        self._update_gauges()
+        return connection
+
+    def disconnect(self, connection: Connection):
+        connections = self.active_connections.get(connection.user_id)
+        if not connections or connections.pop(connection.id, None) is None:
+            return
+        self.connection_count -= 1
+        if not connections:
+            del self.active_connections[connection.user_id]
+            if connection.user_id in self.user_rooms:
+                # Keep room membership for a while so a reconnecting device doesn't need to rejoin
+                self.offline_since[connection.user_id] = time.monotonic()
+        logger.info(f"User {connection.user_id} disconnected")
+        self._update_gauges()
+
+    async def receive(self, connection: Connection) -> dict:
+        message = await connection.websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        connection.last_seen = time.monotonic()
+        data = message.get("text")
+        if data is None:
+            data = message.get("bytes")
+        return connection.codec.decode(data)
+
+    async def send_personal_message(self, message: dict, user_id: str):
+        await self.send_to_users(message, [user_id])
+
+    async def send_to_users(self, message: dict, user_ids: List[str]):
+        connections = [
+            connection
+            for user_id in user_ids
+            for connection in list(self.active_connections.get(user_id, {}).values())
+        ]
+        await self._send_to_connections(message, connections)
+
+    async def send_to_connection(self, message: dict, connection: Connection):
+        await self._send_to_connections(message, [connection])
+
+    async def _send_to_connections(self, message: dict, connections: List[Connection]):
+        # Encode once per encoding in use, however many recipients there are
+        frames: Dict[str, Any] = {}
+        for connection in connections:
+            if connection.codec.name not in frames:
+                frames[connection.codec.name] = connection.codec.encode(message)
+        await asyncio.gather(*(
+            self._send_frame(frames[connection.codec.name], connection) for connection in connections
+        ))
+
+    async def _send_frame(self, frame, connection: Connection):
+        websocket = connection.websocket
+        try:
+            with span("websocket", "send"):
+                send = websocket.send_bytes(frame) if isinstance(frame, bytes) else websocket.send_text(frame)
+                # A half-open connection can block a send indefinitely
+                await asyncio.wait_for(send, timeout=self.send_timeout)
+        except Exception as e:
+            logger.error(f"Error sending message to {connection.user_id}: {e!r}")
+            self.disconnect(connection)
+            await self._close(connection, CLOSE_IDLE)
+
+    async def broadcast_to_match(self, message: dict, match_id: str):
+        if match_id in self.match_rooms:
+            await self.send_to_users(message, list(self.match_rooms[match_id]))
+
+    async def join_match_room(self, user_id: str, match_id: str):
+        self.match_rooms.setdefault(match_id, set()).add(user_id)
+        self.user_rooms.setdefault(user_id, set()).add(match_id)
+        logger.info(f"User {user_id} joined match {match_id}")
+        self._update_gauges()
+
+    def leave_match_room(self, user_id: str, match_id: str):
+        members = self.match_rooms.get(match_id)
+        if members is not None:
+            members.discard(user_id)
+            if not members:
+                del self.match_rooms[match_id]
+        rooms = self.user_rooms.get(user_id)
+        if rooms is not None:
+            rooms.discard(match_id)
+            if not rooms:
+                del self.user_rooms[user_id]
+                self.offline_since.pop(user_id, None)
+        self._update_gauges()
+
+    def close_match_room(self, match_id: str):
+        """Tear down a room, e.g. once its match has completed"""
+        for user_id in list(self.match_rooms.get(match_id, ())):
+            self.leave_match_room(user_id, match_id)
+
+    async def run_heartbeat(self):
+        """Ping connections and evict idle ones until cancelled"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                logger.error(f"WebSocket heartbeat failed: {e}")
+
+    async def heartbeat(self):
+        now = time.monotonic()
+        alive: List[Connection] = []
+        for connections in list(self.active_connections.values()):
+            for connection in list(connections.values()):
+                if now - connection.last_seen > self.idle_timeout:
+                    logger.info(f"Closing idle connection of user {connection.user_id}")
+                    self.disconnect(connection)
+                    await self._close(connection, CLOSE_IDLE)
+                else:
+                    alive.append(connection)
+
+        for user_id, since in list(self.offline_since.items()):
+            if now - since > self.room_grace:
+                for match_id in list(self.user_rooms.get(user_id, ())):
+                    self.leave_match_room(user_id, match_id)
+                self.offline_since.pop(user_id, None)
+
+        # Any message counts as activity, clients answer pings with a pong
+        await self._send_to_connections({"type": "ping"}, alive)
+
+    @staticmethod
+    async def _close(connection: Connection, code: int):
+        try:
+            await connection.websocket.close(code=code)
+        except Exception:
+            # Already closed or the transport is gone
+            pass
+
+    def _update_gauges(self):
+        WS_CONNECTIONS.set(self.connection_count)
+        WS_CONNECTED_USERS.set(len(self.active_connections))
+        WS_MATCH_ROOMS.set(len(self.match_rooms))
@@ -0,0 +1,119 @@
+"""Bounded conversation memory for the AI buddy chat.
+
+Each user gets a ring buffer of recent turns plus a rolling summary of older
+ones. When the turns outgrow their token budget the oldest are folded into
+the summary, and prompts are assembled under a fixed token ceiling, so the
+prompt cost per message is capped no matter how long a conversation runs.
+Memories of recently active users are kept in an LRU cache so the history
+is only read from ``chat_messages`` when a user comes back after a while.
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List, Tuple
+
+# Rough token estimate (~4 characters per token for English text and code)
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    limit = max_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:max(0, limit - 3)] + "..."
+
+
+class ConversationMemory:
+    def __init__(self, max_turns: int, turn_budget: int, summary_budget: int):
+        self.turns: Deque[Tuple[str, str]] = deque(maxlen=max_turns)
+        self.summary_lines: Deque[str] = deque()
+        self.turn_budget = turn_budget
+        self.summary_budget = summary_budget
+        self._turn_tokens = 0
+        self._summary_tokens = 0
+        self.loaded_at = time.monotonic()
+
+    @property
+    def summary(self) -> str:
+        return "\n".join(self.summary_lines)
+
+    def append(self, sender: str, content: str):
+        if len(self.turns) == self.turns.maxlen:
+            # The ring buffer is about to drop its oldest turn, keep its gist
+            self._fold(*self.turns[0])
+            self._turn_tokens -= estimate_tokens(self.turns[0][1])
+        self.turns.append((sender, content))
+        self._turn_tokens += estimate_tokens(content)
+        while self._turn_tokens > self.turn_budget and len(self.turns) > 1:
+            self._fold(*self.turns[0])
+            self._turn_tokens -= estimate_tokens(self.turns.popleft()[1])
+
+    def _fold(self, sender: str, content: str):
+        """Compress a turn into one short summary line, dropping the oldest lines past the budget"""
+        first_sentence = content.strip().split("\n", 1)[0].split(". ", 1)[0]
+        line = f"{'User' if sender == 'user' else 'Buddy'}: {_truncate(first_sentence, 30)}"
+        self.summary_lines.append(line)
+        self._summary_tokens += estimate_tokens(line)
+        while self._summary_tokens > self.summary_budget and self.summary_lines:
+            self._summary_tokens -= estimate_tokens(self.summary_lines.popleft())
+
+    def build_messages(self, system_prompt: str, message: str, ceiling: int) -> List[Dict[str, str]]:
+        """Chat messages for the next completion, totalling at most ``ceiling`` tokens.
+
+        The system prompt and the new message always go in; the remaining
+        budget is filled with the most recent turns first, then the summary.
+        """
+        message = _truncate(message, ceiling // 2)
+        budget = ceiling - estimate_tokens(system_prompt) - estimate_tokens(message)
+
+        history: List[Dict[str, str]] = []
+        for sender, content in reversed(self.turns):
+            cost = estimate_tokens(content)
+            if cost > budget:
+                break
+            budget -= cost
+            history.append({"role": "user" if sender == "user" else "assistant", "content": content})
+        history.reverse()
+
+        messages = [{"role": "system", "content": system_prompt}]
+        if self.summary_lines and budget > 20:
+            summary = _truncate(self.summary, budget - 10)
+            messages.append({"role": "system", "content": f"Earlier in this conversation:\n{summary}"})
+        return messages + history + [{"role": "user", "content": message}]
+
+
+class ConversationStore:
+    """LRU cache of per-user memories, loading history on a miss.
+
+    ``load_history(user_id, limit)`` must return the user's most recent
+    ``chat_messages`` rows, oldest first; it is run in a worker thread.
+    """
+
+    def __init__(self, load_history: Callable[[str, int], List[Dict]], max_turns: int = 20,
+                 turn_budget: int = 1200, summary_budget: int = 300, max_users: int = 2000,
+                 max_age: float = 900):
+        self.load_history = load_history
+        self.max_turns = max_turns
+        self.turn_budget = turn_budget
+        self.summary_budget = summary_budget
+        self.max_users = max_users
+        self.max_age = max_age
+        self._memories: "OrderedDict[str, ConversationMemory]" = OrderedDict()
+
+    async def get(self, user_id: str) -> ConversationMemory:
+        memory = self._memories.get(user_id)
+        if memory is not None and time.monotonic() - memory.loaded_at < self.max_age:
+            self._memories.move_to_end(user_id)
+            return memory
+
+        rows = await asyncio.to_thread(self.load_history, user_id, self.max_turns)
+        memory = ConversationMemory(self.max_turns, self.turn_budget, self.summary_budget)
+        for row in rows:
+            memory.append(row["sender"], row["content"])
+        self._memories[user_id] = memory
+        self._memories.move_to_end(user_id)
+        while len(self._memories) > self.max_users:
+            self._memories.popitem(last=False)
+        return memory
@@ -0,0 +1,55 @@
+"""In-process event bus.
+
+Publishers never wait: events go onto a bounded queue and a single
+dispatcher task hands them to subscribers in order, so subscribers see each
+user's events in the order they happened and don't need their own locking.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, NamedTuple
+
+from observability import Counter, registry
+
+logger = logging.getLogger(__name__)
+
+EVENTS = registry.register(Counter(
+    "events_total",
+    "Events published on the in-process bus by outcome (queued, dropped, failed).",
+    ("event", "result"),
+))
+
+
+class XPEvent(NamedTuple):
+    user_id: str
+    amount: int
+    source: str
+
+
+class EventBus:
+    def __init__(self, max_pending: int = 10000):
+        self._handlers: List[Callable[[Any], Awaitable[None]]] = []
+        self._queue: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=max_pending)
+
+    def subscribe(self, handler: Callable[[Any], Awaitable[None]]):
+        self._handlers.append(handler)
+        return handler
+
+    def publish(self, event: Any):
+        name = type(event).__name__
+        try:
+            self._queue.put_nowait(event)
+            EVENTS.inc(name, "queued")
+        except asyncio.QueueFull:
+            EVENTS.inc(name, "dropped")
+            logger.warning(f"Event queue full, dropping {event}")
+
+    async def run(self):
+        """Dispatch events to subscribers until cancelled"""
+        while True:
+            event = await self._queue.get()
+            for handler in self._handlers:
+                try:
+                    await handler(event)
+                except Exception as e:
+                    EVENTS.inc(type(event).__name__, "failed")
+                    logger.error(f"Event handler {handler.__name__} failed on {event}: {e}")
@@ -0,0 +1,154 @@
+"""Daily goal progress driven by XP events.
+
+Today's goals of recently active users are kept in memory. Each XP event
+advances the matching goals there, and the increments are written back in
+batches every ``flush_interval`` seconds (one atomic write per batch, adding
+one increment per changed goal however many events it took), so several
+workers tracking the same user add up instead of overwriting each other. A
+goal reaching its target, locally or once the increments of every worker are
+added up, is completed.
+"""
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from events import XPEvent
+
+logger = logging.getLogger(__name__)
+
+GOAL_FLUSH_INTERVAL = float(os.getenv("GOAL_FLUSH_INTERVAL", "5"))
+
+# Goal type -> XP sources that count as one step towards it.
+# "xp" goals advance by the amount of every XP event instead.
+GOAL_SOURCES = {
+    "battles": {"battle_win"},
+    "quests": {"diy_complete", "review"},
+    "cards": {"flashcard"},
+}
+
+# XP paid out for completing a goal must not advance other goals
+UNTRACKED_SOURCES = {"daily_goal"}
+
+
+def goal_increment(goal_type: str, event: XPEvent) -> int:
+    if event.source in UNTRACKED_SOURCES:
+        return 0
+    if goal_type == "xp":
+        return max(0, event.amount)
+    return 1 if event.source in GOAL_SOURCES.get(goal_type, ()) else 0
+
+
+class GoalTracker:
+    """Tracks progress on today's ``daily_goals`` rows.
+
+    ``load_goals(user_id, day)`` returns a user's goal rows for a day and
+    ``save_progress([(goal_id, increment), ...])`` adds progress to the
+    goals that are not completed yet, all of it or none, and returns the
+    updated rows; both run in a worker thread. ``on_completed(user_id, goal)``
+    is awaited when a goal reaches its target and must be safe to call more
+    than once.
+    """
+
+    def __init__(self, load_goals: Callable[[str, str], List[Dict]],
+                 save_progress: Callable[[List[Tuple[str, int]]], List[Dict]],
+                 on_completed: Callable[[str, Dict[str, Any]], Awaitable[None]],
+                 flush_interval: float = GOAL_FLUSH_INTERVAL, max_users: int = 10000):
+        self.load_goals = load_goals
+        self.save_progress = save_progress
+        self.on_completed = on_completed
+        self.flush_interval = flush_interval
+        self.max_users = max_users
+        # user_id -> (day, goal_id -> goal row)
+        self._goals: "OrderedDict[str, Tuple[str, Dict[str, Dict[str, Any]]]]" = OrderedDict()
+        # Progress not written yet, goal_id -> increment
+        self._pending: Dict[str, int] = {}
+
+    async def handle(self, event: XPEvent):
+        goals = await self._goals_for(event.user_id)
+        for goal in goals.values():
+            if goal["completed"]:
+                continue
+            increment = goal_increment(goal["type"], event)
+            if not increment:
+                continue
+            goal["current"] = min(goal["target"], goal["current"] + increment)
+            if goal["current"] >= goal["target"]:
+                await self._complete(event.user_id, goal)
+            else:
+                self._pending[goal["id"]] = self._pending.get(goal["id"], 0) + increment
+
+    async def _complete(self, user_id: str, goal: Dict[str, Any]):
+        goal["completed"] = True
+        self._pending.pop(goal["id"], None)
+        await self.on_completed(user_id, dict(goal))
+
+    async def _goals_for(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        today = date.today().isoformat()
+        entry = self._goals.get(user_id)
+        if entry is not None and entry[0] == today:
+            self._goals.move_to_end(user_id)
+            return entry[1]
+
+        rows = await asyncio.to_thread(self.load_goals, user_id, today)
+        goals = {}
+        for row in rows:
+            # Progress not flushed yet is on top of the database
+            row["current"] = min(row["target"], row["current"] + self._pending.get(row["id"], 0))
+            goals[row["id"]] = row
+        self._goals[user_id] = (today, goals)
+        self._goals.move_to_end(user_id)
+        while len(self._goals) > self.max_users:
+            self._goals.popitem(last=False)
+        return goals
+
+    def goals(self, user_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Today's goals of a user with in-memory progress, None if not tracked"""
+        entry = self._goals.get(user_id)
+        if entry is None or entry[0] != date.today().isoformat():
+            return None
+        return list(entry[1].values())
+
+    def mark_completed(self, user_id: str, goal: Dict[str, Any]):
+        """Record a goal completed outside the tracker, e.g. by the complete endpoint"""
+        self._pending.pop(goal["id"], None)
+        entry = self._goals.get(user_id)
+        if entry is not None and goal["id"] in entry[1]:
+            entry[1][goal["id"]] = goal
+
+    def invalidate(self, user_id: str):
+        """Reload a user's goals on their next event; unflushed progress is kept"""
+        self._goals.pop(user_id, None)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            rows = await asyncio.to_thread(self.save_progress, list(pending.items()))
+        except Exception:
+            # Nothing was applied: retry on the next flush, together with anything added since
+            for goal_id, increment in pending.items():
+                self._pending[goal_id] = self._pending.get(goal_id, 0) + increment
+            raise
+
+        # The database has every worker's progress: adopt it, plus what arrived meanwhile
+        for row in rows:
+            entry = self._goals.get(row["user_id"])
+            goal = entry[1].get(row["id"]) if entry is not None else None
+            if goal is None or goal["completed"]:
+                continue
+            goal["current"] = min(goal["target"], row["current"] + self._pending.get(row["id"], 0))
+            if goal["current"] >= goal["target"]:
+                await self._complete(row["user_id"], goal)
+
+    async def run(self):
+        """Flush progress periodically until cancelled"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush goal progress: {e}")
@@ -0,0 +1,228 @@
+"""Persistent background jobs with retries.
+
+Jobs are stored in a local SQLite database, so they survive restarts and
+can be shared by several worker processes on one host. Each process runs a
+bounded number of worker tasks that claim due jobs with a lease; a job
+whose worker died is picked up again once its lease expires. Failed jobs
+are retried with exponential backoff and jitter up to ``max_attempts``.
+Jobs enqueued with an idempotency key are only created once per key.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from observability import Counter, registry
+from serialization import dumps_text
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+
+JOBS = registry.register(Counter(
+    "background_jobs_total",
+    "Background job runs by kind and outcome (succeeded, retried, failed).",
+    ("kind", "result"),
+))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+  id TEXT PRIMARY KEY,
+  kind TEXT NOT NULL,
+  payload TEXT NOT NULL,
+  user_id TEXT,
+  idempotency_key TEXT UNIQUE,
+  status TEXT NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'succeeded', 'failed'
+  attempts INTEGER NOT NULL DEFAULT 0,
+  max_attempts INTEGER NOT NULL,
+  run_at REAL NOT NULL,
+  lease_until REAL,
+  result TEXT,
+  error TEXT,
+  created_at REAL NOT NULL,
+  updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, run_at);
+"""
+
+PUBLIC_FIELDS = ("id", "kind", "status", "attempts", "max_attempts", "result", "error", "created_at", "updated_at")
+
+
+class JobQueue:
+    def __init__(self, path: str = JOBS_DB_PATH, concurrency: int = JOB_WORKERS,
+                 max_attempts: int = JOB_MAX_ATTEMPTS, timeout: float = 120, base_backoff: float = 2,
+                 max_backoff: float = 300, retention: float = 86400, poll_interval: float = 1,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+
+    def handler(self, kind: str):
+        """Register the coroutine function running jobs of ``kind``"""
+        def decorator(func):
+            self.handlers[kind] = func
+            return func
+        return decorator
+
+    def _execute(self, sql: str, params: tuple = (), write: bool = False) -> List[Dict[str, Any]]:
+        with self._db_lock:
+            if self._db is None:
+                self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+                self._db.row_factory = sqlite3.Row
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.executescript(SCHEMA)
+            if not write:
+                return [dict(row) for row in self._db.execute(sql, params)]
+            # IMMEDIATE takes the write lock up front, so claims from other processes can't interleave
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = [dict(row) for row in self._db.execute(sql, params)]
+                self._db.execute("COMMIT")
+                return rows
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    async def enqueue(self, kind: str, payload: Dict[str, Any], user_id: Optional[str] = None,
+                      idempotency_key: Optional[str] = None, max_attempts: Optional[int] = None) -> Dict[str, Any]:
+        """Queue a job, or return the existing one for ``idempotency_key``"""
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind {kind!r}")
+        now = self.clock()
+        rows = await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO jobs (id, kind, payload, user_id, idempotency_key, max_attempts, run_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (idempotency_key) DO NOTHING RETURNING *",
+            (str(uuid.uuid4()), kind, dumps_text(payload), user_id, idempotency_key,
+             max_attempts or self.max_attempts, now, now, now),
+            True,
+        )
+        if not rows:
+            rows = await asyncio.to_thread(self._execute, "SELECT * FROM jobs WHERE idempotency_key = ?", (idempotency_key,))
+        else:
+            self._wakeup.set()
+        return self._public(rows[0])
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = await asyncio.to_thread(self._execute, "SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._public(rows[0]) if rows else None
+
+    @staticmethod
+    def _public(row: Dict[str, Any]) -> Dict[str, Any]:
+        job = {field: row[field] for field in PUBLIC_FIELDS}
+        job["user_id"] = row["user_id"]
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        now = self.clock()
+        rows = self._execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated_at = ? "
+            "WHERE id = (SELECT id FROM jobs WHERE (status = 'queued' AND run_at <= ?) "
+            "OR (status = 'running' AND lease_until < ?) ORDER BY run_at LIMIT 1) RETURNING *",
+            (now + self.timeout + 30, now, now, now),
+            True,
+        )
+        return rows[0] if rows else None
+
+    def _next_due_in(self) -> float:
+        rows = self._execute("SELECT MIN(run_at) AS run_at FROM jobs WHERE status = 'queued'")
+        run_at = rows[0]["run_at"]
+        return self.poll_interval if run_at is None else min(self.poll_interval, max(0.0, run_at - self.clock()))
+
+    async def run(self):
+        """Run ``concurrency`` workers until cancelled"""
+        workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        try:
+            await self._purge_loop()
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def run_next(self) -> bool:
+        """Claim and run one due job, False if none was due"""
+        job = await asyncio.to_thread(self._claim)
+        if job is None:
+            return False
+        await self._run_job(job)
+        return True
+
+    async def _worker(self):
+        while True:
+            try:
+                if await self.run_next():
+                    continue
+                self._wakeup.clear()
+                idle = await asyncio.to_thread(self._next_due_in)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), idle)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker error: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def _run_job(self, job: Dict[str, Any]):
+        kind = job["kind"]
+        try:
+            handler = self.handlers[kind]
+            result = await asyncio.wait_for(handler(json.loads(job["payload"])), self.timeout)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            now = self.clock()
+            if job["attempts"] >= job["max_attempts"]:
+                JOBS.inc(kind, "failed")
+                logger.error(f"Job {kind} {job['id']} failed after {job['attempts']} attempts: {error}")
+                await asyncio.to_thread(
+                    self._execute, "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                    (error, now, job["id"]), True,
+                )
+            else:
+                JOBS.inc(kind, "retried")
+                delay = min(self.max_backoff, self.base_backoff * 2 ** (job["attempts"] - 1))
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning(f"Job {kind} {job['id']} attempt {job['attempts']} failed, retrying in {delay:.1f}s: {error}")
+                await asyncio.to_thread(
+                    self._execute, "UPDATE jobs SET status = 'queued', error = ?, run_at = ?, updated_at = ? WHERE id = ?",
+                    (error, now + delay, now, job["id"]), True,
+                )
+            return
+
+        JOBS.inc(kind, "succeeded")
+        await asyncio.to_thread(
+            self._execute, "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, updated_at = ? WHERE id = ?",
+            (dumps_text(result), self.clock(), job["id"]), True,
+        )
+
+    async def _purge_loop(self):
+        """Delete finished jobs past the retention period so the database stays small"""
+        while True:
+            try:
+                await asyncio.to_thread(
+                    self._execute, "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND updated_at < ?",
+                    (self.clock() - self.retention,), True,
+                )
+            except Exception as e:
+                logger.error(f"Failed to purge old jobs: {e}")
+            await asyncio.sleep(min(self.retention, 3600))
@@ -1,19 +1,43 @@
 from dotenv import load_dotenv
 load_dotenv()
 import os
-from fastapi import FastAPI, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from supabase import create_client, Client
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, TYPE_CHECKING
 import asyncio
 import json
+import time
 import uuid
 from datetime import datetime, timedelta, date
-import openai
 from contextlib import asynccontextmanager
 import logging
+from observability import (
+    PROMETHEUS_CONTENT_TYPE,
+    RequestTimingMiddleware,
+    instrument_http_client,
+    registry,
+    span,
+)
+from ratelimit import RateLimiter
+from cache import cached_read
+from conversation import ConversationMemory, ConversationStore
+from serialization import FastJSONResponse, dumps, omit_fields, parse_timestamp
+from connections import ConnectionManager
+from battle_timer import BattleTimer
+from ws_codec import WS_MAX_MESSAGE_SIZE
+from search import STORED_FIELDS, SubmissionSearch
+from summary import UserSummaryStore
+from events import EventBus, XPEvent
+from goals import GoalTracker
+from jobs import JobQueue
+from similarity import SimilarityChecker
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from supabase import Client
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -23,56 +47,108 @@ logger = logging.getLogger(__name__)
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY", "")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+WS_PER_MESSAGE_DEFLATE = os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() != "false"
+
+# Clients are created on first use (or by the lifespan warm-up) so that importing
+# this module stays cheap and works without credentials, e.g. for tooling.
+_supabase_client: Optional["Client"] = None
+_openai_client: Optional["OpenAI"] = None
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set")
+def get_supabase() -> "Client":
+    global _supabase_client
+    if _supabase_client is None:
+        if not SUPABASE_URL or not SUPABASE_KEY:
+            raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set")
+        from supabase import create_client
+        client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        instrument_http_client(client.postgrest.session, "supabase")
+        _supabase_client = client
+    return _supabase_client
 
-if OPENAI_API_KEY:
-    openai.api_key = OPENAI_API_KEY
+def get_openai_client() -> Optional["OpenAI"]:
+    """OpenAI client, or None when no API key is configured"""
+    global _openai_client
+    if _openai_client is None and OPENAI_API_KEY:
+        # Also honours OPENAI_BASE_URL (used by the benchmark fakes)
+        from openai import OpenAI
+        _openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    return _openai_client
+
+def warm_up():
+    """Create clients and open pooled connections before serving traffic"""
+    client = get_supabase()
+    get_openai_client()
+    try:
+        # A cheap query establishes the keep-alive connection to PostgREST
+        client.table("profiles").select("id").limit(1).execute()
+    except Exception as e:
+        logger.warning(f"Warm-up query failed: {e}")
+    # Build the OpenAPI schema now rather than on the first /docs hit
+    app.openapi()
 
-# Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+@asynccontextmanager
+async def lifespan(app: "FastAPI"):
+    await asyncio.to_thread(warm_up)
+    await recover_battle_deadlines()
+    background = [
+        asyncio.create_task(manager.run_heartbeat()),
+        asyncio.create_task(battle_timer.run()),
+        asyncio.create_task(submission_search.run()),
+        asyncio.create_task(event_bus.run()),
+        asyncio.create_task(goal_tracker.run()),
+        asyncio.create_task(jobs.run()),
+    ]
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+        try:
+            await goal_tracker.flush()
+        except Exception as e:
+            logger.error(f"Failed to flush goal progress on shutdown: {e}")
 
 # WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.match_rooms: Dict[str, List[str]] = {}
-
-    async def connect(self, websocket: WebSocket, user_id: str):
-        await websocket.accept()
-        self.active_connections[user_id] = websocket
-        logger.info(f"User {user_id} connected")
-
-    def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            del self.active_connections[user_id]
-            logger.info(f"User {user_id} disconnected")
-
-    async def send_personal_message(self, message: dict, user_id: str):
-        if user_id in self.active_connections:
-            try:
-                await self.active_connections[user_id].send_text(json.dumps(message))
-            except Exception as e:
-                logger.error(f"Error sending message to {user_id}: {e}")
-                self.disconnect(user_id)
+manager = ConnectionManager()
 
-    async def broadcast_to_match(self, message: dict, match_id: str):
-        if match_id in self.match_rooms:
-            for user_id in self.match_rooms[match_id]:
-                await self.send_personal_message(message, user_id)
+# Background jobs (handlers are registered next to the code they run)
+jobs = JobQueue()
 
-    async def join_match_room(self, user_id: str, match_id: str):
-        if match_id not in self.match_rooms:
-            self.match_rooms[match_id] = []
-        if user_id not in self.match_rooms[match_id]:
-            self.match_rooms[match_id].append(user_id)
-        logger.info(f"User {user_id} joined match {match_id}")
+# Battle deadlines
+SUBMISSION_GRACE_SECONDS = 5
 
-manager = ConnectionManager()
+async def expire_match(match_id: str):
+    try:
+        await finalize_match(match_id, timed_out=True)
+    except Exception as e:
+        logger.error(f"Error finalizing expired match {match_id}: {e}")
+
+async def send_match_tick(match_id: str, remaining: int):
+    await manager.broadcast_to_match({"type": "match_tick", "match_id": match_id, "remaining": remaining}, match_id)
+
+battle_timer = BattleTimer(on_expire=expire_match, on_tick=send_match_tick)
+
+async def recover_battle_deadlines():
+    """Reschedule the deadlines of matches that were active before a restart"""
+    try:
+        active = await asyncio.to_thread(
+            lambda: get_supabase().table("matches").select("id, started_at, time_limit").eq("status", "active").execute()
+        )
+    except Exception as e:
+        logger.warning(f"Could not recover battle deadlines: {e}")
+        return
+    for match in active.data:
+        if match["started_at"]:
+            battle_timer.schedule(match["id"], parse_timestamp(match["started_at"]), match["time_limit"])
+    logger.info(f"Recovered {len(battle_timer)} battle deadlines")
 
 # FastAPI app
-app = FastAPI(title="AI Companion Quest API", version="1.0.0")
+app = FastAPI(
+    title="AI Companion Quest API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -81,6 +157,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestTimingMiddleware)
 
 # Security
 security = HTTPBearer()
@@ -145,7 +222,8 @@ class ReviewCreate(BaseModel):
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         # Verify JWT token with Supabase
-        user = supabase.auth.get_user(credentials.credentials)
+        with span("supabase", "auth.get_user"):
+            user = get_supabase().auth.get_user(credentials.credentials)
         if not user.user:
             raise HTTPException(status_code=401, detail="Invalid token")
         return user.user
@@ -153,56 +231,65 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         logger.error(f"Auth error: {e}")
         raise HTTPException(status_code=401, detail="Invalid token")
 
+rate_limiter = RateLimiter.from_env()
+
+def rate_limited(route_class: str):
+    """Route dependency enforcing the per-user token bucket of a route class"""
+    async def check_rate_limit(current_user = Depends(get_current_user)):
+        retry_after = await rate_limiter.check(route_class, current_user.id)
+        if retry_after:
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded",
+                headers=RateLimiter.retry_after_header(retry_after)
+            )
+    return Depends(check_rate_limit)
+
 async def get_user_profile(user_id: str):
     try:
-        result = supabase.table("profiles").select("*").eq("id", user_id).single().execute()
+        result = get_supabase().table("profiles").select("*").eq("id", user_id).single().execute()
         return result.data
     except Exception as e:
         logger.error(f"Error getting user profile: {e}")
         return None
 
-async def update_user_xp(user_id: str, amount: int, source: str, description: str = None):
-    try:
-        # Log XP transaction
-        supabase.table("xp_logs").insert({
-            "user_id": user_id,
-            "amount": amount,
-            "source": source,
-            "description": description
-        }).execute()
-        
-        # Update user profile
-        profile = await get_user_profile(user_id)
-        if profile:
-            new_xp = profile["xp"] + amount
-            new_total_xp = profile["total_xp"] + amount
-            new_level = max(1, (new_total_xp // 1000) + 1)
-            
-            supabase.table("profiles").update({
-                "xp": new_xp,
-                "total_xp": new_total_xp,
-                "level": new_level
-            }).eq("id", user_id).execute()
-            
-            return {"xp": new_xp, "total_xp": new_total_xp, "level": new_level}
-    except Exception as e:
-        logger.error(f"Error updating XP: {e}")
-        return None
+async def update_user_xp(user_id: str, amount: int, source: str, description: str = None,
+                         idempotency_key: Optional[str] = None):
+    """Log XP and add it to the profile in one transaction, raising on failure.
+
+    An award with an ``idempotency_key`` is only applied once; repeating it
+    returns the profile's XP without changing anything.
+    """
+    result = get_supabase().rpc("award_xp", {
+        "user_id": user_id,
+        "amount": amount,
+        "source": source,
+        "description": description,
+        "idempotency_key": idempotency_key
+    }).execute().data
+    
+    update = {"xp": result["xp"], "total_xp": result["total_xp"], "level": result["level"]}
+    if result["applied"]:
+        user_summary.update(user_id, "profile", lambda p: {**p, **update})
+        user_summary.update(user_id, "recent_xp", lambda logs: ([result["log"]] + logs)[:SUMMARY_RECENT_XP])
+        user_summary.invalidate(user_id, "rank")
+        event_bus.publish(XPEvent(user_id, amount, source))
+    return update
 
 async def update_daily_streak(user_id: str):
     try:
         today = date.today()
         
         # Check if user already has activity today
-        existing = supabase.table("streaks").select("*").eq("user_id", user_id).eq("date", today).execute()
+        existing = get_supabase().table("streaks").select("*").eq("user_id", user_id).eq("date", today).execute()
         
         if not existing.data:
             # Get yesterday's streak
             yesterday = today - timedelta(days=1)
-            yesterday_streak = supabase.table("streaks").select("*").eq("user_id", user_id).eq("date", yesterday).execute()
+            yesterday_streak = get_supabase().table("streaks").select("*").eq("user_id", user_id).eq("date", yesterday).execute()
             
             # Create today's streak entry
-            supabase.table("streaks").insert({
+            get_supabase().table("streaks").insert({
                 "user_id": user_id,
                 "date": today,
                 "activities": [],
@@ -213,10 +300,13 @@ async def update_daily_streak(user_id: str):
             profile = await get_user_profile(user_id)
             if profile:
                 new_streak = profile["streak_days"] + 1 if yesterday_streak.data else 1
-                supabase.table("profiles").update({
+                get_supabase().table("profiles").update({
                     "streak_days": new_streak,
                     "last_activity_date": today
                 }).eq("id", user_id).execute()
+                user_summary.update(user_id, "profile", lambda p: {
+                    **p, "streak_days": new_streak, "last_activity_date": today.isoformat()
+                })
                 
                 return new_streak
     except Exception as e:
@@ -283,63 +373,82 @@ def evaluate_code(code: str, test_cases: List[Dict], problem_type: str = "functi
     except Exception as e:
         return {"score": 0, "passed": 0, "total": len(test_cases), "error": str(e)}
 
-async def generate_diy_task(topic: str, level: str, technologies: List[str], project_type: str) -> Dict:
-    """Generate a DIY coding task using OpenAI"""
-    if not OPENAI_API_KEY:
+def fallback_diy_task(topic: str, level: str, technologies: List[str], project_type: str) -> Dict:
+    """Predefined DIY task used when OpenAI is unavailable"""
+    return {
+        "title": f"{topic} Practice Project",
+        "description": f"Build a {project_type} focused on {topic} concepts at {level} level.",
+        "features": [
+            f"Implement core {topic} functionality",
+            "Add user interface components",
+            "Include error handling",
+            "Write basic tests"
+        ],
+        "challenges": [
+            f"Master {topic} concepts",
+            "Create responsive design",
+            "Optimize performance"
+        ],
+        "files": [
+            {"name": "src/App.tsx", "type": "component", "lines": 100},
+            {"name": "src/components/Main.tsx", "type": "component", "lines": 80}
+        ]
+    }
+
+def request_diy_task(topic: str, level: str, technologies: List[str], project_type: str) -> Dict:
+    """Ask OpenAI for a DIY coding task; blocking, raises on failure"""
+    openai_client = get_openai_client()
+    if openai_client is None:
         # Fallback to predefined tasks if no OpenAI key
-        return {
-            "title": f"{topic} Practice Project",
-            "description": f"Build a {project_type} focused on {topic} concepts at {level} level.",
-            "features": [
-                f"Implement core {topic} functionality",
-                "Add user interface components",
-                "Include error handling",
-                "Write basic tests"
-            ],
-            "challenges": [
-                f"Master {topic} concepts",
-                "Create responsive design",
-                "Optimize performance"
-            ],
-            "files": [
-                {"name": "src/App.tsx", "type": "component", "lines": 100},
-                {"name": "src/components/Main.tsx", "type": "component", "lines": 80}
-            ]
-        }
+        return fallback_diy_task(topic, level, technologies, project_type)
     
-    try:
-        prompt = f"""
-        Generate a coding project for learning {topic} at {level} level.
-        Project type: {project_type}
-        Technologies: {', '.join(technologies)}
-        
-        Return a JSON object with:
-        - title: Project name
-        - description: Detailed project description
-        - features: Array of 4-6 key features to implement
-        - challenges: Array of 3-4 learning challenges
-        - files: Array of file objects with name, type, and estimated lines
-        
-        Make it practical and educational.
-        """
-        
-        response = openai.ChatCompletion.create(
+    prompt = f"""
+    Generate a coding project for learning {topic} at {level} level.
+    Project type: {project_type}
+    Technologies: {', '.join(technologies)}
+    
+    Return a JSON object with:
+    - title: Project name
+    - description: Detailed project description
+    - features: Array of 4-6 key features to implement
+    - challenges: Array of 3-4 learning challenges
+    - files: Array of file objects with name, type, and estimated lines
+    
+    Make it practical and educational.
+    """
+    
+    with span("openai", "diy_task"):
+        response = openai_client.chat.completions.create(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
             max_tokens=1000,
             temperature=0.7
         )
-        
-        content = response.choices[0].message.content
-        return json.loads(content)
-        
+    
+    content = response.choices[0].message.content
+    return json.loads(content)
+
+async def generate_diy_task(topic: str, level: str, technologies: List[str], project_type: str) -> Dict:
+    """Generate a DIY coding task using OpenAI"""
+    try:
+        return request_diy_task(topic, level, technologies, project_type)
     except Exception as e:
         logger.error(f"Error generating DIY task: {e}")
-        return generate_diy_task(topic, level, technologies, project_type)  # Fallback
+        return fallback_diy_task(topic, level, technologies, project_type)  # Fallback
+
+# Upper bound on prompt tokens per buddy message, history and summary included
+BUDDY_PROMPT_TOKEN_CEILING = 2000
 
-async def generate_ai_response(message: str, personality: str, user_context: Dict) -> str:
-    """Generate AI buddy response using OpenAI"""
-    if not OPENAI_API_KEY:
+def load_chat_history(user_id: str, limit: int) -> List[Dict]:
+    result = get_supabase().table("chat_messages").select("content, sender").eq("user_id", user_id).order("created_at", desc=True).limit(limit).execute()
+    return list(reversed(result.data))
+
+conversations = ConversationStore(load_chat_history)
+
+async def generate_ai_response(message: str, personality: str, user_context: Dict, memory: Optional[ConversationMemory] = None) -> str:
+    """Generate AI buddy response using OpenAI, with the user's recent conversation as context"""
+    openai_client = get_openai_client()
+    if openai_client is None:
         # Fallback responses
         responses = {
             "ada": f"I understand you're working on something challenging. Let's break it down step by step. What specific part would you like help with?",
@@ -369,17 +478,20 @@ async def generate_ai_response(message: str, personality: str, user_context: Dic
         User context:
         - Level: {user_level}
         - Current mood: {user_mood}
-        - Message: {message}
         
         Respond in character, keeping it helpful and under 200 words.
         """
         
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[{"role": "system", "content": prompt}],
-            max_tokens=200,
-            temperature=0.8
-        )
+        memory = memory or ConversationMemory(max_turns=1, turn_budget=0, summary_budget=0)
+        messages = memory.build_messages(prompt, message, BUDDY_PROMPT_TOKEN_CEILING)
+        
+        with span("openai", "buddy_chat"):
+            response = openai_client.chat.completions.create(
+                model="gpt-4",
+                messages=messages,
+                max_tokens=200,
+                temperature=0.8
+            )
         
         return response.choices[0].message.content
         
@@ -393,6 +505,10 @@ async def generate_ai_response(message: str, personality: str, user_context: Dic
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 # Profile endpoints
 @app.get("/api/profile")
 async def get_profile(current_user = Depends(get_current_user)):
@@ -401,36 +517,40 @@ async def get_profile(current_user = Depends(get_current_user)):
         raise HTTPException(status_code=404, detail="Profile not found")
     return profile
 
-@app.post("/api/profile")
+@app.post("/api/profile", dependencies=[rate_limited("write")])
 async def create_profile(profile_data: UserProfile, current_user = Depends(get_current_user)):
     try:
-        result = supabase.table("profiles").insert({
+        result = get_supabase().table("profiles").insert({
             "id": current_user.id,
             "username": profile_data.username,
             "avatar": profile_data.avatar
         }).execute()
+        user_summary.invalidate(current_user.id)
         return result.data[0]
     except Exception as e:
         logger.error(f"Error creating profile: {e}")
         raise HTTPException(status_code=400, detail="Failed to create profile")
 
-@app.put("/api/profile")
+@app.put("/api/profile", dependencies=[rate_limited("write")])
 async def update_profile(profile_data: UserProfile, current_user = Depends(get_current_user)):
     try:
-        result = supabase.table("profiles").update({
+        result = get_supabase().table("profiles").update({
             "username": profile_data.username,
             "avatar": profile_data.avatar
         }).eq("id", current_user.id).execute()
+        user_summary.update(current_user.id, "profile", lambda p: result.data[0])
         return result.data[0]
     except Exception as e:
         logger.error(f"Error updating profile: {e}")
         raise HTTPException(status_code=400, detail="Failed to update profile")
 
 # XP endpoints
-@app.post("/api/xp/add")
+@app.post("/api/xp/add", dependencies=[rate_limited("xp")])
 async def add_xp(xp_data: XPTransaction, current_user = Depends(get_current_user)):
-    result = await update_user_xp(current_user.id, xp_data.amount, xp_data.source, xp_data.description)
-    if not result:
+    try:
+        result = await update_user_xp(current_user.id, xp_data.amount, xp_data.source, xp_data.description)
+    except Exception as e:
+        logger.error(f"Error updating XP: {e}")
         raise HTTPException(status_code=400, detail="Failed to add XP")
     
     # Update streak
@@ -441,17 +561,17 @@ async def add_xp(xp_data: XPTransaction, current_user = Depends(get_current_user
 @app.get("/api/xp/logs")
 async def get_xp_logs(current_user = Depends(get_current_user)):
     try:
-        result = supabase.table("xp_logs").select("*").eq("user_id", current_user.id).order("created_at", desc=True).limit(50).execute()
+        result = get_supabase().table("xp_logs").select("*").eq("user_id", current_user.id).order("created_at", desc=True).limit(50).execute()
         return {"logs": result.data}
     except Exception as e:
         logger.error(f"Error getting XP logs: {e}")
         raise HTTPException(status_code=400, detail="Failed to get XP logs")
 
 # Mood tracking endpoints
-@app.post("/api/mood/log")
+@app.post("/api/mood/log", dependencies=[rate_limited("write")])
 async def log_mood(mood_data: MoodLog, current_user = Depends(get_current_user)):
     try:
-        result = supabase.table("mood_logs").insert({
+        result = get_supabase().table("mood_logs").insert({
             "user_id": current_user.id,
             "mood": mood_data.mood,
             "intensity": mood_data.intensity,
@@ -464,7 +584,9 @@ async def log_mood(mood_data: MoodLog, current_user = Depends(get_current_user))
         }).execute()
         
         # Update profile mood
-        supabase.table("profiles").update({"mood": mood_data.mood}).eq("id", current_user.id).execute()
+        get_supabase().table("profiles").update({"mood": mood_data.mood}).eq("id", current_user.id).execute()
+        user_summary.update(current_user.id, "profile", lambda p: {**p, "mood": mood_data.mood})
+        user_summary.update(current_user.id, "mood", lambda moods: (result.data + moods)[:SUMMARY_MOOD_WINDOW])
         
         return result.data[0]
     except Exception as e:
@@ -474,19 +596,19 @@ async def log_mood(mood_data: MoodLog, current_user = Depends(get_current_user))
 @app.get("/api/mood/history")
 async def get_mood_history(current_user = Depends(get_current_user)):
     try:
-        result = supabase.table("mood_logs").select("*").eq("user_id", current_user.id).order("created_at", desc=True).limit(30).execute()
+        result = get_supabase().table("mood_logs").select("*").eq("user_id", current_user.id).order("created_at", desc=True).limit(30).execute()
         return {"history": result.data}
     except Exception as e:
         logger.error(f"Error getting mood history: {e}")
         raise HTTPException(status_code=400, detail="Failed to get mood history")
 
 # Battle endpoints
-@app.post("/api/battles/create")
+@app.post("/api/battles/create", dependencies=[rate_limited("write")])
 async def create_battle(battle_data: MatchCreate, current_user = Depends(get_current_user)):
     try:
         # Get a random problem template if none specified
         if not battle_data.problem_title:
-            templates = supabase.table("matches").select("*").eq("status", "template").execute()
+            templates = get_supabase().table("matches").select("*").eq("status", "template").execute()
             if templates.data:
                 import random
                 template = random.choice(templates.data)
@@ -505,7 +627,7 @@ async def create_battle(battle_data: MatchCreate, current_user = Depends(get_cur
             test_cases = []
             starter_code = "# Your code here"
         
-        result = supabase.table("matches").insert({
+        result = get_supabase().table("matches").insert({
             "creator_id": current_user.id,
             "problem_title": problem_title,
             "problem_description": problem_description,
@@ -520,149 +642,289 @@ async def create_battle(battle_data: MatchCreate, current_user = Depends(get_cur
         match_id = result.data[0]["id"]
         
         # Add creator as participant
-        supabase.table("match_participants").insert({
+        get_supabase().table("match_participants").insert({
             "match_id": match_id,
             "user_id": current_user.id
         }).execute()
         
+        load_active_battles.cache.invalidate()
         return {"match_id": match_id, "status": "created"}
     except Exception as e:
         logger.error(f"Error creating battle: {e}")
         raise HTTPException(status_code=400, detail="Failed to create battle")
 
+# Columns of battle lists; the large test_cases, starter_code and solution
+# fields are only selected when include_details is set
+BATTLE_LIST_COLUMNS = "id, creator_id, problem_title, problem_description, difficulty, xp_wager, status, mode, max_players, time_limit, created_at, started_at"
+
+# Hot unauthenticated reads are coalesced and cached for a couple of seconds,
+# then served stale while a single background query refreshes them. They
+# cache the encoded response body so hits skip serialization entirely.
+@cached_read(ttl=2, stale_ttl=10)
+def load_active_battles(include_details: bool = False):
+    columns = "*" if include_details else BATTLE_LIST_COLUMNS
+    result = get_supabase().table("matches").select(f"{columns}, profiles!creator_id(username, avatar)").in_("status", ["waiting", "active"]).order("created_at", desc=True).execute()
+    
+    battles = []
+    for battle in result.data:
+        # Get participant count
+        participants = get_supabase().table("match_participants").select("user_id").eq("match_id", battle["id"]).execute()
+        
+        battles.append({
+            **battle,
+            "participant_count": len(participants.data),
+            "creator": battle["profiles"]
+        })
+    
+    return dumps({"battles": battles})
+
 @app.get("/api/battles/active")
-async def get_active_battles():
+async def get_active_battles(include_details: bool = False):
     try:
-        result = supabase.table("matches").select("*, profiles!creator_id(username, avatar)").in_("status", ["waiting", "active"]).order("created_at", desc=True).execute()
-        
-        battles = []
-        for battle in result.data:
-            # Get participant count
-            participants = supabase.table("match_participants").select("user_id").eq("match_id", battle["id"]).execute()
-            
-            battles.append({
-                **battle,
-                "participant_count": len(participants.data),
-                "creator": battle["profiles"]
-            })
-        
-        return {"battles": battles}
+        return FastJSONResponse(await load_active_battles(include_details))
     except Exception as e:
         logger.error(f"Error getting active battles: {e}")
         raise HTTPException(status_code=400, detail="Failed to get active battles")
 
-@app.post("/api/battles/{match_id}/join")
+@app.post("/api/battles/{match_id}/join", dependencies=[rate_limited("write")])
 async def join_battle(match_id: str, current_user = Depends(get_current_user)):
     try:
         # Check if match exists and is joinable
-        match = supabase.table("matches").select("*").eq("id", match_id).single().execute()
+        match = get_supabase().table("matches").select("*").eq("id", match_id).single().execute()
         if not match.data or match.data["status"] != "waiting":
             raise HTTPException(status_code=400, detail="Match not available")
         
         # Check if user already joined
-        existing = supabase.table("match_participants").select("*").eq("match_id", match_id).eq("user_id", current_user.id).execute()
+        existing = get_supabase().table("match_participants").select("*").eq("match_id", match_id).eq("user_id", current_user.id).execute()
         if existing.data:
             raise HTTPException(status_code=400, detail="Already joined this match")
         
         # Add participant
-        supabase.table("match_participants").insert({
+        get_supabase().table("match_participants").insert({
             "match_id": match_id,
             "user_id": current_user.id
         }).execute()
         
         # Check if match is full
-        participants = supabase.table("match_participants").select("*").eq("match_id", match_id).execute()
+        participants = get_supabase().table("match_participants").select("*").eq("match_id", match_id).execute()
         if len(participants.data) >= match.data["max_players"]:
-            # Start the match
-            supabase.table("matches").update({
+            # Start the match, the server clock is authoritative for its deadline
+            started_at = time.time()
+            get_supabase().table("matches").update({
                 "status": "active",
-                "started_at": datetime.utcnow().isoformat()
+                "started_at": datetime.utcfromtimestamp(started_at).isoformat()
             }).eq("id", match_id).execute()
+            battle_timer.schedule(match_id, started_at, match.data["time_limit"])
             
             # Notify all participants
-            for participant in participants.data:
-                await manager.send_personal_message({
-                    "type": "match_started",
-                    "match_id": match_id,
-                    "message": "Match is starting!"
-                }, participant["user_id"])
-        
+            await manager.send_to_users({
+                "type": "match_started",
+                "match_id": match_id,
+                "message": "Match is starting!",
+                "time_limit": match.data["time_limit"]
+            }, [p["user_id"] for p in participants.data])
+        
+        load_active_battles.cache.invalidate()
         return {"status": "joined"}
     except Exception as e:
         logger.error(f"Error joining battle: {e}")
         raise HTTPException(status_code=400, detail="Failed to join battle")
 
-@app.post("/api/battles/{match_id}/submit")
+@jobs.handler("award_xp")
+async def run_award_xp_job(payload: Dict[str, Any]) -> Dict:
+    return await update_user_xp(payload["user_id"], payload["amount"], payload["source"],
+                                payload.get("description"), payload.get("idempotency_key"))
+
+async def queue_xp_award(user_id: str, amount: int, source: str, description: str, key: str):
+    """Award XP from a retried job, so a failed write neither fails the request
+    that earned it nor loses the XP. The award is granted once per ``key``."""
+    await jobs.enqueue("award_xp", {
+        "user_id": user_id,
+        "amount": amount,
+        "source": source,
+        "description": description,
+        "idempotency_key": key
+    }, user_id=user_id, idempotency_key=key)
+
+@jobs.handler("battle_stats")
+async def run_battle_stats_job(payload: Dict[str, Any]):
+    # Counted once per match, however often the job is retried
+    await asyncio.to_thread(lambda: get_supabase().rpc("record_battle_win", {
+        "match_id": payload["match_id"],
+        "user_id": payload["user_id"]
+    }).execute())
+    user_summary.invalidate(payload["user_id"], "profile")
+
+async def finalize_match(match_id: str, timed_out: bool = False):
+    """Complete an active match, reward the winner and notify participants.
+
+    Safe to call more than once: only the call that moves the match out of
+    ``active`` does anything.
+    """
+    battle_timer.cancel(match_id)
+    match = get_supabase().table("matches").select("*").eq("id", match_id).single().execute()
+    if match.data["status"] != "active":
+        return
+    
+    # Determine the winner among those who submitted before the deadline
+    all_participants = get_supabase().table("match_participants").select("*").eq("match_id", match_id).execute()
+    submitted = [p for p in all_participants.data if p["code_submission"]]
+    winner = max(submitted, key=lambda p: p["score"] or 0) if submitted else None
+    
+    ended = get_supabase().table("matches").update({
+        "status": "completed",
+        "ended_at": datetime.utcnow().isoformat(),
+        "winner_id": winner["user_id"] if winner else None
+    }).eq("id", match_id).eq("status", "active").execute()
+    if not ended.data:
+        # Finalized concurrently
+        return
+    load_active_battles.cache.invalidate()
+    
+    if winner:
+        # Rewards run as jobs so a failed write is retried. Keying the jobs on
+        # the match queues them once however often this runs, and keying the
+        # writes on it applies them once however often a job is retried
+        await queue_xp_award(winner["user_id"], match.data["xp_wager"], "battle_win",
+                             f"Won battle: {match.data['problem_title']}", f"battle_xp:{match_id}")
+        await jobs.enqueue("battle_stats", {"match_id": match_id, "user_id": winner["user_id"]},
+                           user_id=winner["user_id"], idempotency_key=f"battle_stats:{match_id}")
+    
+    # Notify all participants of results, without everyone's code
+    await manager.send_to_users({
+        "type": "match_ended",
+        "match_id": match_id,
+        "winner_id": winner["user_id"] if winner else None,
+        "reason": "time_limit" if timed_out else "all_submitted",
+        "results": omit_fields(all_participants.data, ["code_submission"])
+    }, [p["user_id"] for p in all_participants.data])
+    manager.close_match_room(match_id)
+
+# Submission similarity
+def load_problem_submissions(problem_title: str, since: Optional[str] = None) -> List[Dict]:
+    params = {"title": problem_title}
+    if since is not None:
+        params["since"] = since
+    return get_supabase().rpc("problem_submissions", params).execute().data or []
+
+def save_similarity_score(participant_id: str, score: float, similar_to: Optional[str]):
+    get_supabase().table("match_participants").update({
+        "similarity_score": score,
+        "similar_to": similar_to
+    }).eq("id", participant_id).execute()
+
+similarity_checker = SimilarityChecker(load_problem_submissions, save_similarity_score)
+
+@jobs.handler("similarity_check")
+async def run_similarity_check_job(payload: Dict[str, Any]) -> Dict:
+    return await similarity_checker.check(
+        payload["participant_id"], payload["user_id"], payload["problem_title"], payload["code"],
+        payload["submitted_at"]
+    )
+
+@app.post("/api/battles/{match_id}/submit", dependencies=[rate_limited("write")])
 async def submit_code(match_id: str, submission: CodeSubmission, current_user = Depends(get_current_user)):
     try:
         # Get match and participant info
-        match = supabase.table("matches").select("*").eq("id", match_id).single().execute()
+        match = get_supabase().table("matches").select("*").eq("id", match_id).single().execute()
         if not match.data:
             raise HTTPException(status_code=404, detail="Match not found")
         
-        participant = supabase.table("match_participants").select("*").eq("match_id", match_id).eq("user_id", current_user.id).single().execute()
+        participant = get_supabase().table("match_participants").select("*").eq("match_id", match_id).eq("user_id", current_user.id).single().execute()
         if not participant.data:
             raise HTTPException(status_code=404, detail="Not a participant")
         
+        if match.data["status"] != "active":
+            raise HTTPException(status_code=400, detail="Match is not active")
+        
+        # Completion time comes from the scheduler's clock, falling back to the
+        # stored start time for matches scheduled by another worker
+        elapsed = battle_timer.elapsed(match_id)
+        if elapsed is None:
+            elapsed = time.time() - parse_timestamp(match.data["started_at"])
+        if elapsed > match.data["time_limit"] + SUBMISSION_GRACE_SECONDS:
+            raise HTTPException(status_code=400, detail="Time limit exceeded")
+        completion_time = int(elapsed)
+        
         # Evaluate code
         test_cases = match.data.get("test_cases", [])
-        evaluation = evaluate_code(submission.code, test_cases)
-        
-        # Calculate completion time
-        started_at = datetime.fromisoformat(match.data["started_at"].replace('Z', '+00:00'))
-        completion_time = int((datetime.utcnow() - started_at.replace(tzinfo=None)).total_seconds())
+        with span("evaluate_code"):
+            evaluation = evaluate_code(submission.code, test_cases)
         
         # Update participant
-        supabase.table("match_participants").update({
+        submitted_at = datetime.utcnow().isoformat()
+        get_supabase().table("match_participants").update({
             "code_submission": submission.code,
             "score": evaluation["score"],
             "completion_time": completion_time,
             "tests_passed": evaluation["passed"],
             "total_tests": evaluation["total"],
-            "submitted_at": datetime.utcnow().isoformat()
+            "submitted_at": submitted_at
         }).eq("match_id", match_id).eq("user_id", current_user.id).execute()
         
+        # Compare against earlier submissions to the problem off the request path
+        await jobs.enqueue("similarity_check", {
+            "participant_id": participant.data["id"],
+            "user_id": current_user.id,
+            "problem_title": match.data["problem_title"],
+            "code": submission.code,
+            "submitted_at": submitted_at
+        }, user_id=current_user.id, idempotency_key=f"similarity:{participant.data['id']}:{submitted_at}")
+        
         # Check if all participants have submitted
-        all_participants = supabase.table("match_participants").select("*").eq("match_id", match_id).execute()
+        all_participants = get_supabase().table("match_participants").select("*").eq("match_id", match_id).execute()
         submitted_count = sum(1 for p in all_participants.data if p["code_submission"])
         
         if submitted_count >= len(all_participants.data):
-            # End match and determine winner
-            winner = max(all_participants.data, key=lambda p: p["score"] or 0)
-            
-            supabase.table("matches").update({
-                "status": "completed",
-                "ended_at": datetime.utcnow().isoformat(),
-                "winner_id": winner["user_id"]
-            }).eq("id", match_id).execute()
-            
-            # Award XP to winner
-            xp_reward = match.data["xp_wager"]
-            await update_user_xp(winner["user_id"], xp_reward, "battle_win", f"Won battle: {match.data['problem_title']}")
-            
-            # Update battle stats
-            supabase.table("profiles").update({
-                "total_battles": supabase.table("profiles").select("total_battles").eq("id", winner["user_id"]).single().execute().data["total_battles"] + 1,
-                "battles_won": supabase.table("profiles").select("battles_won").eq("id", winner["user_id"]).single().execute().data["battles_won"] + 1
-            }).eq("id", winner["user_id"]).execute()
-            
-            # Notify all participants of results
-            for participant in all_participants.data:
-                await manager.send_personal_message({
-                    "type": "match_ended",
-                    "match_id": match_id,
-                    "winner_id": winner["user_id"],
-                    "results": all_participants.data
-                }, participant["user_id"])
+            await finalize_match(match_id)
         
         return evaluation
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error submitting code: {e}")
         raise HTTPException(status_code=400, detail="Failed to submit code")
 
 # DIY Task endpoints
-@app.post("/api/diy/generate")
-async def generate_diy(task_data: DIYTaskGenerate, current_user = Depends(get_current_user)):
+def save_diy_task(user_id: str, task_data: DIYTaskGenerate, generated_task: Dict) -> Dict:
+    result = get_supabase().table("diy_tasks").insert({
+        "user_id": user_id,
+        "title": generated_task["title"],
+        "description": generated_task["description"],
+        "difficulty": task_data.level,
+        "technologies": task_data.technologies,
+        "xp_reward": 500 + (len(task_data.technologies) * 50),
+        "features": generated_task["features"],
+        "challenges": generated_task["challenges"],
+        "files": generated_task["files"],
+        "prompt_used": f"Topic: {task_data.topic}, Level: {task_data.level}",
+        "gpt_response": generated_task
+    }).execute()
+    return result.data[0]
+
+@jobs.handler("diy_generate")
+async def run_diy_generate_job(payload: Dict[str, Any]) -> Dict:
+    # No fallback here: a failed OpenAI call is retried with backoff instead
+    task_data = DIYTaskGenerate(**payload["task"])
+    generated_task = await asyncio.to_thread(
+        request_diy_task, task_data.topic, task_data.level, task_data.technologies, task_data.project_type
+    )
+    return await asyncio.to_thread(save_diy_task, payload["user_id"], task_data, generated_task)
+
+@app.post("/api/diy/generate", dependencies=[rate_limited("llm")])
+async def generate_diy(task_data: DIYTaskGenerate, background: bool = False,
+                       idempotency_key: Optional[str] = Header(None),
+                       current_user = Depends(get_current_user)):
+    if background:
+        # Queue the generation and return a job to poll instead of holding the request open
+        job = await jobs.enqueue(
+            "diy_generate",
+            {"user_id": current_user.id, "task": task_data.model_dump()},
+            user_id=current_user.id,
+            idempotency_key=f"diy_generate:{current_user.id}:{idempotency_key}" if idempotency_key else None,
+            max_attempts=3,
+        )
+        return FastJSONResponse(job, status_code=202)
     try:
         # Generate task using OpenAI
         generated_task = await generate_diy_task(
@@ -673,51 +935,46 @@ async def generate_diy(task_data: DIYTaskGenerate, current_user = Depends(get_cu
         )
         
         # Save to database
-        result = supabase.table("diy_tasks").insert({
-            "user_id": current_user.id,
-            "title": generated_task["title"],
-            "description": generated_task["description"],
-            "difficulty": task_data.level,
-            "technologies": task_data.technologies,
-            "xp_reward": 500 + (len(task_data.technologies) * 50),
-            "features": generated_task["features"],
-            "challenges": generated_task["challenges"],
-            "files": generated_task["files"],
-            "prompt_used": f"Topic: {task_data.topic}, Level: {task_data.level}",
-            "gpt_response": generated_task
-        }).execute()
-        
-        return result.data[0]
+        return save_diy_task(current_user.id, task_data, generated_task)
     except Exception as e:
         logger.error(f"Error generating DIY task: {e}")
         raise HTTPException(status_code=400, detail="Failed to generate DIY task")
 
+# Background job status
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, current_user = Depends(get_current_user)):
+    job = await jobs.get(job_id)
+    if job is None or job["user_id"] != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.get("/api/diy/tasks")
 async def get_diy_tasks(current_user = Depends(get_current_user)):
     try:
-        result = supabase.table("diy_tasks").select("*").eq("user_id", current_user.id).order("created_at", desc=True).execute()
+        result = get_supabase().table("diy_tasks").select("*").eq("user_id", current_user.id).order("created_at", desc=True).execute()
         return {"tasks": result.data}
     except Exception as e:
         logger.error(f"Error getting DIY tasks: {e}")
         raise HTTPException(status_code=400, detail="Failed to get DIY tasks")
 
-@app.post("/api/diy/tasks/{task_id}/complete")
+@app.post("/api/diy/tasks/{task_id}/complete", dependencies=[rate_limited("write")])
 async def complete_diy_task(task_id: str, current_user = Depends(get_current_user)):
     try:
         # Get task
-        task = supabase.table("diy_tasks").select("*").eq("id", task_id).eq("user_id", current_user.id).single().execute()
+        task = get_supabase().table("diy_tasks").select("*").eq("id", task_id).eq("user_id", current_user.id).single().execute()
         if not task.data:
             raise HTTPException(status_code=404, detail="Task not found")
         
         # Mark as completed
-        supabase.table("diy_tasks").update({
+        get_supabase().table("diy_tasks").update({
             "status": "completed",
             "completed_at": datetime.utcnow().isoformat()
         }).eq("id", task_id).execute()
         
         # Award XP
         xp_reward = task.data["xp_reward"]
-        await update_user_xp(current_user.id, xp_reward, "diy_complete", f"Completed DIY: {task.data['title']}")
+        await queue_xp_award(current_user.id, xp_reward, "diy_complete", f"Completed DIY: {task.data['title']}",
+                             f"diy_complete:{task_id}")
         
         return {"status": "completed", "xp_earned": xp_reward}
     except Exception as e:
@@ -725,7 +982,7 @@ async def complete_diy_task(task_id: str, current_user = Depends(get_current_use
         raise HTTPException(status_code=400, detail="Failed to complete DIY task")
 
 # AI Buddy endpoints
-@app.post("/api/buddy/chat")
+@app.post("/api/buddy/chat", dependencies=[rate_limited("llm")])
 async def chat_with_buddy(message: ChatMessage, current_user = Depends(get_current_user)):
     try:
         # Get user context
@@ -736,11 +993,12 @@ async def chat_with_buddy(message: ChatMessage, current_user = Depends(get_curre
             "xp": profile["xp"] if profile else 0
         }
         
-        # Generate AI response
-        ai_response = await generate_ai_response(message.content, message.personality, user_context)
+        # Generate AI response, continuing the conversation so far
+        memory = await conversations.get(current_user.id)
+        ai_response = await generate_ai_response(message.content, message.personality, user_context, memory)
         
         # Save user message
-        supabase.table("chat_messages").insert({
+        get_supabase().table("chat_messages").insert({
             "user_id": current_user.id,
             "content": message.content,
             "sender": "user",
@@ -748,13 +1006,15 @@ async def chat_with_buddy(message: ChatMessage, current_user = Depends(get_curre
         }).execute()
         
         # Save AI response
-        supabase.table("chat_messages").insert({
+        get_supabase().table("chat_messages").insert({
             "user_id": current_user.id,
             "content": ai_response,
             "sender": "ai",
             "personality": message.personality
         }).execute()
         
+        memory.append("user", message.content)
+        memory.append("ai", ai_response)
         return {"response": ai_response}
     except Exception as e:
         logger.error(f"Error in buddy chat: {e}")
@@ -763,49 +1023,54 @@ async def chat_with_buddy(message: ChatMessage, current_user = Depends(get_curre
 @app.get("/api/buddy/history")
 async def get_chat_history(current_user = Depends(get_current_user)):
     try:
-        result = supabase.table("chat_messages").select("*").eq("user_id", current_user.id).order("created_at", desc=True).limit(50).execute()
+        result = get_supabase().table("chat_messages").select("*").eq("user_id", current_user.id).order("created_at", desc=True).limit(50).execute()
         return {"messages": result.data}
     except Exception as e:
         logger.error(f"Error getting chat history: {e}")
         raise HTTPException(status_code=400, detail="Failed to get chat history")
 
 # Flashcard endpoints
+# Card content rarely changes; play counters may lag by up to the TTL
+@cached_read(ttl=10, stale_ttl=60)
+def load_flashcards(category: Optional[str] = None, difficulty: Optional[str] = None):
+    query = get_supabase().table("flashcards").select("*")
+    if category:
+        query = query.eq("category", category)
+    if difficulty:
+        query = query.eq("difficulty", difficulty)
+    
+    result = query.execute()
+    return dumps({"cards": result.data})
+
 @app.get("/api/flashcards")
 async def get_flashcards(category: Optional[str] = None, difficulty: Optional[str] = None):
     try:
-        query = supabase.table("flashcards").select("*")
-        if category:
-            query = query.eq("category", category)
-        if difficulty:
-            query = query.eq("difficulty", difficulty)
-        
-        result = query.execute()
-        return {"cards": result.data}
+        return FastJSONResponse(await load_flashcards(category, difficulty))
     except Exception as e:
         logger.error(f"Error getting flashcards: {e}")
         raise HTTPException(status_code=400, detail="Failed to get flashcards")
 
-@app.post("/api/flashcards/{card_id}/play")
+@app.post("/api/flashcards/{card_id}/play", dependencies=[rate_limited("write")])
 async def play_flashcard(card_id: str, correct: bool, response_time: float, current_user = Depends(get_current_user)):
     try:
         # Get card
-        card = supabase.table("flashcards").select("*").eq("id", card_id).single().execute()
+        card = get_supabase().table("flashcards").select("*").eq("id", card_id).single().execute()
         if not card.data:
             raise HTTPException(status_code=404, detail="Card not found")
         
         # Update card stats
-        supabase.table("flashcards").update({
+        get_supabase().table("flashcards").update({
             "times_played": card.data["times_played"] + 1,
             "correct_answers": card.data["correct_answers"] + (1 if correct else 0)
         }).eq("id", card_id).execute()
         
         # Update user's card stats
-        user_card = supabase.table("user_flashcards").select("*").eq("user_id", current_user.id).eq("flashcard_id", card_id).execute()
+        user_card = get_supabase().table("user_flashcards").select("*").eq("user_id", current_user.id).eq("flashcard_id", card_id).execute()
         
         if user_card.data:
             # Update existing
             uc = user_card.data[0]
-            supabase.table("user_flashcards").update({
+            get_supabase().table("user_flashcards").update({
                 "times_played": uc["times_played"] + 1,
                 "correct_answers": uc["correct_answers"] + (1 if correct else 0),
                 "average_response_time": (uc["average_response_time"] * uc["times_played"] + response_time) / (uc["times_played"] + 1),
@@ -813,7 +1078,7 @@ async def play_flashcard(card_id: str, correct: bool, response_time: float, curr
             }).eq("id", uc["id"]).execute()
         else:
             # Create new
-            supabase.table("user_flashcards").insert({
+            get_supabase().table("user_flashcards").insert({
                 "user_id": current_user.id,
                 "flashcard_id": card_id,
                 "owned": True,
@@ -827,7 +1092,9 @@ async def play_flashcard(card_id: str, correct: bool, response_time: float, curr
         xp_earned = 0
         if correct:
             xp_earned = card.data["xp_value"]
-            await update_user_xp(current_user.id, xp_earned, "flashcard", f"Correct answer: {card.data['question'][:50]}...")
+            # Each play earns XP, so the key only stops retries of this one from awarding it twice
+            await queue_xp_award(current_user.id, xp_earned, "flashcard", f"Correct answer: {card.data['question'][:50]}...",
+                                 f"flashcard:{card_id}:{uuid.uuid4()}")
         
         return {"xp_earned": xp_earned, "correct": correct}
     except Exception as e:
@@ -835,10 +1102,10 @@ async def play_flashcard(card_id: str, correct: bool, response_time: float, curr
         raise HTTPException(status_code=400, detail="Failed to play flashcard")
 
 # Submission endpoints (Architect Mode)
-@app.post("/api/submissions/create")
+@app.post("/api/submissions/create", dependencies=[rate_limited("write")])
 async def create_submission(submission_data: SubmissionCreate, current_user = Depends(get_current_user)):
     try:
-        result = supabase.table("submissions").insert({
+        result = get_supabase().table("submissions").insert({
             "title": submission_data.title,
             "description": submission_data.description,
             "author_id": current_user.id,
@@ -849,53 +1116,84 @@ async def create_submission(submission_data: SubmissionCreate, current_user = De
             "xp_reward": 100 + len(submission_data.tags) * 25  # Base reward + bonus for tags
         }).execute()
         
+        load_submissions.cache.invalidate()
+        submission_search.add(result.data[0])
         return result.data[0]
     except Exception as e:
         logger.error(f"Error creating submission: {e}")
         raise HTTPException(status_code=400, detail="Failed to create submission")
 
+@cached_read(ttl=2, stale_ttl=10)
+def load_submissions(status: Optional[str] = None):
+    query = get_supabase().table("submissions").select("*, profiles!author_id(username, avatar)")
+    if status:
+        query = query.eq("status", status)
+    
+    result = query.order("created_at", desc=True).execute()
+    
+    # Get review stats for each submission
+    submissions = []
+    for submission in result.data:
+        reviews = get_supabase().table("reviews").select("rating").eq("submission_id", submission["id"]).execute()
+        avg_rating = sum(r["rating"] for r in reviews.data) / len(reviews.data) if reviews.data else 0
+        
+        submissions.append({
+            **submission,
+            "author": submission["profiles"],
+            "review_count": len(reviews.data),
+            "average_rating": round(avg_rating, 1)
+        })
+    
+    return dumps({"submissions": submissions})
+
 @app.get("/api/submissions")
 async def get_submissions(status: Optional[str] = None):
     try:
-        query = supabase.table("submissions").select("*, profiles!author_id(username, avatar)")
-        if status:
-            query = query.eq("status", status)
-        
-        result = query.order("created_at", desc=True).execute()
-        
-        # Get review stats for each submission
-        submissions = []
-        for submission in result.data:
-            reviews = supabase.table("reviews").select("rating").eq("submission_id", submission["id"]).execute()
-            avg_rating = sum(r["rating"] for r in reviews.data) / len(reviews.data) if reviews.data else 0
-            
-            submissions.append({
-                **submission,
-                "author": submission["profiles"],
-                "review_count": len(reviews.data),
-                "average_rating": round(avg_rating, 1)
-            })
-        
-        return {"submissions": submissions}
+        return FastJSONResponse(await load_submissions(status))
     except Exception as e:
         logger.error(f"Error getting submissions: {e}")
         raise HTTPException(status_code=400, detail="Failed to get submissions")
 
-@app.post("/api/submissions/{submission_id}/review")
+def load_submission_page(since: Optional[str], offset: int, limit: int):
+    query = get_supabase().table("submissions").select(", ".join(STORED_FIELDS + ("updated_at",)))
+    if since:
+        query = query.gte("updated_at", since).order("updated_at")
+    else:
+        query = query.order("created_at")
+    return query.limit(limit).offset(offset).execute().data
+
+def load_submission_deletions(since: Optional[str]):
+    query = get_supabase().table("submission_deletions").select("id, deleted_at")
+    if since:
+        query = query.gte("deleted_at", since)
+    return query.order("deleted_at").execute().data
+
+submission_search = SubmissionSearch(load_submission_page, load_submission_deletions)
+
+@app.get("/api/submissions/search")
+async def search_submissions(q: str = "", tags: List[str] = Query(default=[]), status: Optional[str] = None,
+                             limit: int = Query(default=20, ge=1, le=100), offset: int = Query(default=0, ge=0)):
+    try:
+        return await asyncio.to_thread(submission_search.search, q, tags, status, limit, offset)
+    except Exception as e:
+        logger.error(f"Error searching submissions: {e}")
+        raise HTTPException(status_code=400, detail="Failed to search submissions")
+
+@app.post("/api/submissions/{submission_id}/review", dependencies=[rate_limited("write")])
 async def create_review(submission_id: str, review_data: ReviewCreate, current_user = Depends(get_current_user)):
     try:
         # Check if submission exists
-        submission = supabase.table("submissions").select("*").eq("id", submission_id).single().execute()
+        submission = get_supabase().table("submissions").select("*").eq("id", submission_id).single().execute()
         if not submission.data:
             raise HTTPException(status_code=404, detail="Submission not found")
         
         # Check if user already reviewed
-        existing = supabase.table("reviews").select("*").eq("submission_id", submission_id).eq("reviewer_id", current_user.id).execute()
+        existing = get_supabase().table("reviews").select("*").eq("submission_id", submission_id).eq("reviewer_id", current_user.id).execute()
         if existing.data:
             raise HTTPException(status_code=400, detail="Already reviewed this submission")
         
         # Create review
-        result = supabase.table("reviews").insert({
+        result = get_supabase().table("reviews").insert({
             "submission_id": submission_id,
             "reviewer_id": current_user.id,
             "rating": review_data.rating,
@@ -907,27 +1205,33 @@ async def create_review(submission_id: str, review_data: ReviewCreate, current_u
         }).execute()
         
         # Award XP to reviewer
-        await update_user_xp(current_user.id, 50, "review", f"Reviewed: {submission.data['title']}")
+        await queue_xp_award(current_user.id, 50, "review", f"Reviewed: {submission.data['title']}",
+                             f"review:{result.data[0]['id']}")
         
+        load_submissions.cache.invalidate()
         return result.data[0]
     except Exception as e:
         logger.error(f"Error creating review: {e}")
         raise HTTPException(status_code=400, detail="Failed to create review")
 
 # Leaderboard endpoint
+@cached_read(ttl=2, stale_ttl=10)
+def load_leaderboard():
+    result = get_supabase().table("profiles").select("username, avatar, level, xp, total_xp, streak_days, battles_won, quests_completed").order("total_xp", desc=True).limit(100).execute()
+    
+    leaderboard = []
+    for i, user in enumerate(result.data, 1):
+        leaderboard.append({
+            "rank": i,
+            **user
+        })
+    
+    return dumps({"leaderboard": leaderboard})
+
 @app.get("/api/leaderboard")
 async def get_leaderboard():
     try:
-        result = supabase.table("profiles").select("username, avatar, level, xp, total_xp, streak_days, battles_won, quests_completed").order("total_xp", desc=True).limit(100).execute()
-        
-        leaderboard = []
-        for i, user in enumerate(result.data, 1):
-            leaderboard.append({
-                "rank": i,
-                **user
-            })
-        
-        return {"leaderboard": leaderboard}
+        return FastJSONResponse(await load_leaderboard())
     except Exception as e:
         logger.error(f"Error getting leaderboard: {e}")
         raise HTTPException(status_code=400, detail="Failed to get leaderboard")
@@ -937,7 +1241,7 @@ async def get_leaderboard():
 async def get_daily_goals(current_user = Depends(get_current_user)):
     try:
         today = date.today()
-        result = supabase.table("daily_goals").select("*").eq("user_id", current_user.id).eq("date", today).execute()
+        result = get_supabase().table("daily_goals").select("*").eq("user_id", current_user.id).eq("date", today).execute()
         
         # Create default goals if none exist
         if not result.data:
@@ -948,25 +1252,32 @@ async def get_daily_goals(current_user = Depends(get_current_user)):
             ]
             
             for goal in default_goals:
-                supabase.table("daily_goals").insert({
+                get_supabase().table("daily_goals").insert({
                     "user_id": current_user.id,
-                    "date": today,
+                    "date": today.isoformat(),
                     **goal
                 }).execute()
             
             # Fetch again
-            result = supabase.table("daily_goals").select("*").eq("user_id", current_user.id).eq("date", today).execute()
+            result = get_supabase().table("daily_goals").select("*").eq("user_id", current_user.id).eq("date", today).execute()
+            user_summary.update(current_user.id, "goals", lambda goals: result.data)
+            goal_tracker.invalidate(current_user.id)
+        
+        # Progress tracked in memory may be ahead of the stored rows
+        tracked = goal_tracker.goals(current_user.id)
+        if tracked is not None:
+            return {"goals": tracked}
         
         return {"goals": result.data}
     except Exception as e:
         logger.error(f"Error getting daily goals: {e}")
         raise HTTPException(status_code=400, detail="Failed to get daily goals")
 
-@app.post("/api/goals/{goal_id}/complete")
+@app.post("/api/goals/{goal_id}/complete", dependencies=[rate_limited("write")])
 async def complete_goal(goal_id: str, current_user = Depends(get_current_user)):
     try:
         # Get goal
-        goal = supabase.table("daily_goals").select("*").eq("id", goal_id).eq("user_id", current_user.id).single().execute()
+        goal = get_supabase().table("daily_goals").select("*").eq("id", goal_id).eq("user_id", current_user.id).single().execute()
         if not goal.data:
             raise HTTPException(status_code=404, detail="Goal not found")
         
@@ -974,32 +1285,152 @@ async def complete_goal(goal_id: str, current_user = Depends(get_current_user)):
             raise HTTPException(status_code=400, detail="Goal already completed")
         
         # Mark as completed
-        supabase.table("daily_goals").update({
+        completed = get_supabase().table("daily_goals").update({
             "completed": True,
             "current": goal.data["target"],
             "completed_at": datetime.utcnow().isoformat()
         }).eq("id", goal_id).execute()
+        user_summary.update(current_user.id, "goals", lambda goals: [
+            completed.data[0] if g["id"] == goal_id else g for g in goals
+        ])
+        goal_tracker.mark_completed(current_user.id, completed.data[0])
         
         # Award XP
         xp_reward = goal.data["xp_reward"]
-        await update_user_xp(current_user.id, xp_reward, "daily_goal", f"Completed goal: {goal.data['title']}")
+        await queue_xp_award(current_user.id, xp_reward, "daily_goal", f"Completed goal: {goal.data['title']}",
+                             f"daily_goal:{goal_id}")
         
         return {"status": "completed", "xp_earned": xp_reward}
     except Exception as e:
         logger.error(f"Error completing goal: {e}")
         raise HTTPException(status_code=400, detail="Failed to complete goal")
 
+# Automatic goal progress
+def load_goals_for_day(user_id: str, day: str):
+    return get_supabase().table("daily_goals").select("*").eq("user_id", user_id).eq("date", day).execute().data
+
+def save_goal_progress(increments):
+    # One atomic statement for the whole batch: progress tracked by other workers
+    # isn't overwritten, and a failed flush hasn't applied part of the batch
+    return get_supabase().rpc("increment_goal_progress", {
+        "goal_ids": [goal_id for goal_id, _ in increments],
+        "amounts": [amount for _, amount in increments]
+    }).execute().data
+
+async def complete_tracked_goal(user_id: str, goal: Dict[str, Any]):
+    # Conditional on not being completed yet, so a goal is never rewarded twice
+    completed = get_supabase().table("daily_goals").update({
+        "completed": True,
+        "current": goal["target"],
+        "completed_at": datetime.utcnow().isoformat()
+    }).eq("id", goal["id"]).eq("completed", False).execute()
+    if not completed.data:
+        return
+    
+    goal = completed.data[0]
+    user_summary.update(user_id, "goals", lambda goals: [goal if g["id"] == goal["id"] else g for g in goals])
+    goal_tracker.mark_completed(user_id, goal)
+    await queue_xp_award(user_id, goal["xp_reward"], "daily_goal", f"Completed goal: {goal['title']}",
+                         f"daily_goal:{goal['id']}")
+    await manager.send_personal_message({
+        "type": "goal_completed",
+        "goal": goal,
+        "xp_earned": goal["xp_reward"]
+    }, user_id)
+
+event_bus = EventBus()
+goal_tracker = GoalTracker(load_goals_for_day, save_goal_progress, complete_tracked_goal)
+event_bus.subscribe(goal_tracker.handle)
+
+# User summary (dashboard)
+SUMMARY_RECENT_XP = 10
+SUMMARY_MOOD_WINDOW = 14
+
+def load_summary_profile(user_id: str):
+    return get_supabase().table("profiles").select("*").eq("id", user_id).single().execute().data
+
+def load_summary_rank(user_id: str):
+    profile = get_supabase().table("profiles").select("total_xp").eq("id", user_id).single().execute()
+    ahead = get_supabase().table("profiles").select("id", count="exact").gt("total_xp", profile.data["total_xp"]).limit(1).execute()
+    return (ahead.count or 0) + 1
+
+def load_summary_goals(user_id: str):
+    return get_supabase().table("daily_goals").select("*").eq("user_id", user_id).eq("date", date.today().isoformat()).execute().data
+
+def load_summary_recent_xp(user_id: str):
+    return get_supabase().table("xp_logs").select("*").eq("user_id", user_id).order("created_at", desc=True).limit(SUMMARY_RECENT_XP).execute().data
+
+def load_summary_mood(user_id: str):
+    return get_supabase().table("mood_logs").select("*").eq("user_id", user_id).order("created_at", desc=True).limit(SUMMARY_MOOD_WINDOW).execute().data
+
+user_summary = UserSummaryStore({
+    "profile": load_summary_profile,
+    "rank": load_summary_rank,
+    "goals": load_summary_goals,
+    "recent_xp": load_summary_recent_xp,
+    "mood": load_summary_mood,
+}, ttls={"rank": 30})
+
+def build_summary(sections: Dict[str, Any]) -> Dict[str, Any]:
+    profile = sections["profile"]
+    moods = sections["mood"]
+    mood_counts: Dict[str, int] = {}
+    for mood in moods:
+        mood_counts[mood["mood"]] = mood_counts.get(mood["mood"], 0) + 1
+    
+    return {
+        "profile": profile,
+        "rank": sections["rank"],
+        "streak": {
+            "days": profile["streak_days"],
+            "last_activity_date": profile["last_activity_date"]
+        },
+        "goals": [
+            {**goal, "progress": min(1.0, goal["current"] / goal["target"]) if goal["target"] else 0.0}
+            for goal in sections["goals"]
+        ],
+        "recent_xp": {
+            "logs": sections["recent_xp"],
+            "total": sum(log["amount"] for log in sections["recent_xp"])
+        },
+        "mood_trend": {
+            "recent": [
+                {"mood": m["mood"], "intensity": m["intensity"], "created_at": m["created_at"]}
+                for m in moods
+            ],
+            "dominant_mood": max(mood_counts, key=mood_counts.get) if mood_counts else profile["mood"],
+            "average_intensity": round(sum(m["intensity"] for m in moods) / len(moods), 1) if moods else None
+        }
+    }
+
+@app.get("/api/me/summary")
+async def get_my_summary(current_user = Depends(get_current_user)):
+    try:
+        sections = await user_summary.get(current_user.id)
+        tracked = goal_tracker.goals(current_user.id)
+        if tracked is not None:
+            sections = {**sections, "goals": tracked}
+        return build_summary(sections)
+    except Exception as e:
+        logger.error(f"Error getting summary: {e}")
+        raise HTTPException(status_code=400, detail="Failed to get summary")
+
 # WebSocket endpoint
 @app.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
-    await manager.connect(websocket, user_id)
+    connection = await manager.connect(websocket, user_id)
     try:
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            message = await manager.receive(connection)
             
-            if message["type"] == "join_match":
+            if message["type"] == "pong":
+                # Heartbeat reply, receiving it already marked the connection as alive
+                continue
+            elif message["type"] == "join_match":
                 await manager.join_match_room(user_id, message["match_id"])
+                await manager.send_to_connection({"type": "joined_match", "match_id": message["match_id"]}, connection)
+            elif message["type"] == "leave_match":
+                manager.leave_match_room(user_id, message["match_id"])
             elif message["type"] == "match_message":
                 await manager.broadcast_to_match({
                     "type": "chat_message",
@@ -1016,8 +1447,11 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
                 }, message["match_id"])
             
     except WebSocketDisconnect:
-        manager.disconnect(user_id)
+        pass
+    finally:
+        manager.disconnect(connection)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE,
+                ws_max_size=WS_MAX_MESSAGE_SIZE)
\ No newline at end of file
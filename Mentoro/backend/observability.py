@@ -0,0 +1,243 @@
+"""Request timing, per-dependency spans and Prometheus-format metrics.
+
+Everything here is in-process: metrics are kept in memory and rendered on
+demand by the ``/metrics`` endpoint, so no external collector is required.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this (in milliseconds) are logged with their span
+# breakdown. 0 disables the slow-request log.
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "0"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a fixed set of label names."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        key = tuple(str(v) for v in labelvalues)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # One slot per bucket, then sum and count
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {int(cumulative)}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {int(series[-1])}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {series[-2]}")
+            lines.append(f"{self.name}_count{labels} {int(series[-1])}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by a fixed set of label names"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        key = tuple(str(v) for v in labelvalues)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for key, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Point-in-time value keyed by a fixed set of label names"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labelvalues: str):
+        key = tuple(str(v) for v in labelvalues)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for key, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[Union[Histogram, Counter, Gauge]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests.",
+    ("method", "route", "status"),
+))
+
+DEPENDENCY_LATENCY = registry.register(Histogram(
+    "dependency_call_duration_seconds",
+    "Time spent in external calls (Supabase, OpenAI, code evaluation, WebSocket sends).",
+    ("dependency", "operation"),
+))
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# Spans recorded while handling the current request, None outside a request
+_request_spans: ContextVar[Optional[List[Tuple[str, str, float, float]]]] = ContextVar(
+    "request_spans", default=None
+)
+
+
+@contextmanager
+def span(dependency: str, operation: str = "") -> Iterator[None]:
+    """Time a block as a call to ``dependency`` and attach it to the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        DEPENDENCY_LATENCY.observe(elapsed, dependency, operation)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((dependency, operation, start, elapsed))
+
+
+def instrument_http_client(client, dependency: str):
+    """Record a span for every request sent through an httpx client.
+
+    The operation label is the HTTP method plus the last path segment, which
+    for PostgREST is the table name and keeps label cardinality bounded.
+    """
+    send = client.send
+
+    def timed_send(request, *args, **kwargs):
+        resource = request.url.path.rstrip("/").rsplit("/", 1)[-1]
+        with span(dependency, f"{request.method} {resource}"):
+            return send(request, *args, **kwargs)
+
+    client.send = timed_send
+    return client
+
+
+class RequestTimingMiddleware:
+    """ASGI middleware timing each HTTP request and collecting its spans"""
+
+    def __init__(self, app, slow_threshold_ms: float = SLOW_REQUEST_THRESHOLD_MS):
+        self.app = app
+        self.slow_threshold_ms = slow_threshold_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        spans: List[Tuple[str, str, float, float]] = []
+        token = _request_spans.set(spans)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_spans.reset(token)
+            # Use the route template so path parameters don't explode cardinality
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.observe(elapsed, scope["method"], route_path, str(status_code))
+
+            if self.slow_threshold_ms and elapsed * 1000 >= self.slow_threshold_ms:
+                self._log_slow_request(scope["method"], route_path, status_code, start, elapsed, spans)
+
+    @staticmethod
+    def _log_slow_request(method: str, route: str, status_code: int, start: float,
+                          elapsed: float, spans: List[Tuple[str, str, float, float]]):
+        in_spans = sum(duration for _, _, _, duration in spans)
+        breakdown = ", ".join(
+            f"{dependency}{' ' + operation if operation else ''} "
+            f"@{(offset - start) * 1000:.1f}ms took {duration * 1000:.1f}ms"
+            for dependency, operation, offset, duration in spans
+        )
+        logger.warning(
+            f"Slow request {method} {route} -> {status_code} in {elapsed * 1000:.1f}ms "
+            f"({in_spans * 1000:.1f}ms in {len(spans)} calls): {breakdown or 'no spans'}"
+        )
@@ -0,0 +1,141 @@
+"""Token-bucket rate limiting keyed by user and route class.
+
+Buckets live in process memory by default. Multi-worker deployments can set
+``RATE_LIMIT_REDIS_URL`` to share buckets through Redis instead (requires the
+optional ``redis`` package). Each check is O(1) in either mode.
+"""
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimit(NamedTuple):
+    rate: float      # tokens refilled per second
+    capacity: float  # bucket size, i.e. the allowed burst
+
+
+# Route classes and their default limits, overridable through RATE_LIMITS
+DEFAULT_LIMITS: Dict[str, RateLimit] = {
+    # GPT-4 backed endpoints: 10 per minute, bursts of 3
+    "llm": RateLimit(10 / 60, 3),
+    # Direct XP grants: 30 per minute, bursts of 10
+    "xp": RateLimit(30 / 60, 10),
+    # Other authenticated writes: 120 per minute, bursts of 30
+    "write": RateLimit(2, 30),
+}
+
+
+def parse_limits(spec: str) -> Dict[str, RateLimit]:
+    """Parse ``"llm=10/60:3,xp=30/60"`` into limits.
+
+    Each entry is ``<class>=<requests>/<seconds>[:<burst>]``; the burst
+    defaults to the request count and a count of 0 disables the class.
+    """
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rule = entry.partition("=")
+        rule, _, burst = rule.partition(":")
+        count, _, seconds = rule.partition("/")
+        limits[name.strip()] = RateLimit(float(count) / float(seconds or 1), float(burst or count))
+    return limits
+
+
+class MemoryBucketStore:
+    """Per-process buckets, bounded to ``max_keys`` least recently used entries"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    async def take(self, key: str, limit: RateLimit, cost: float = 1) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [limit.capacity, now]
+            if len(self._buckets) > self.max_keys:
+                # An evicted bucket is simply recreated full, which only ever errs towards allowing
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        tokens = min(limit.capacity, bucket[0] + (now - bucket[1]) * limit.rate)
+        bucket[1] = now
+        if tokens >= cost:
+            bucket[0] = tokens - cost
+            return 0.0
+        bucket[0] = tokens
+        return (cost - tokens) / limit.rate
+
+
+# Refill and take atomically on the Redis server, using its clock so workers agree
+_REDIS_TAKE = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local retry_after = 0
+if tokens >= cost then
+  tokens = tokens - cost
+else
+  retry_after = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+class RedisBucketStore:
+    """Buckets shared by all workers through Redis"""
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_REDIS_URL is set but the 'redis' package is not installed") from e
+        self.prefix = prefix
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(_REDIS_TAKE)
+
+    async def take(self, key: str, limit: RateLimit, cost: float = 1) -> float:
+        result = await self._script(keys=[self.prefix + key], args=[limit.rate, limit.capacity, cost])
+        return float(result)
+
+
+class RateLimiter:
+    def __init__(self, limits: Dict[str, RateLimit], store=None):
+        self.limits = limits
+        self.store = store or MemoryBucketStore()
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        limits = dict(DEFAULT_LIMITS)
+        limits.update(parse_limits(os.getenv("RATE_LIMITS", "")))
+        redis_url = os.getenv("RATE_LIMIT_REDIS_URL", "")
+        return cls(limits, RedisBucketStore(redis_url) if redis_url else None)
+
+    async def check(self, route_class: str, key: str, cost: float = 1) -> float:
+        """Consume ``cost`` tokens; returns 0 if allowed, else seconds until retry"""
+        limit = self.limits.get(route_class)
+        if limit is None or limit.rate <= 0:
+            return 0.0
+        try:
+            return await self.store.take(f"{route_class}:{key}", limit, cost)
+        except Exception as e:
+            # Fail open: a broken shared store must not take the API down with it
+            logger.error(f"Rate limiter error: {e}")
+            return 0.0
+
+    @staticmethod
+    def retry_after_header(seconds: float) -> Dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(seconds)))}
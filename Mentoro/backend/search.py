@@ -0,0 +1,527 @@
+"""In-memory full-text and tag search over Architect Mode submissions.
+
+An inverted index maps each term to the submissions containing it (with
+field-weighted term frequencies) and results are ranked with BM25. Broad
+terms are ranked from postings kept sorted by impact, so only the top of
+each list is scored. Tag and status indexes back filters and facet counts.
+The index is updated in place when a submission is created, caught up
+periodically with rows other workers or clients inserted, changed or
+deleted, and snapshotted to disk so a restart doesn't have to read every
+submission again.
+"""
+import asyncio
+import bisect
+import heapq
+import itertools
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Collection, Dict, FrozenSet, Hashable, Iterable, List, Optional, Set, Tuple
+
+from serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+SEARCH_SNAPSHOT_PATH = os.getenv("SEARCH_SNAPSHOT_PATH", "search_snapshot.json")
+SEARCH_REFRESH_INTERVAL = float(os.getenv("SEARCH_REFRESH_INTERVAL", "60"))
+SNAPSHOT_VERSION = 2
+# How long submission_deletions keeps a deleted id (see its migration)
+SUBMISSION_DELETIONS_RETENTION = 30 * 86400
+# Allowed skew between this host's clock and the database's
+SYNC_CLOCK_MARGIN = 60
+
+# Columns kept per document and returned in search results
+STORED_FIELDS = ("id", "title", "description", "type", "status", "tags", "author_id", "created_at", "xp_reward")
+
+# Term frequency weight per field (a simplified BM25F)
+FIELD_WEIGHTS = {"title": 3, "tags": 2, "description": 1}
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to was with".split()
+)
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[+#][+#]?)?")
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def normalize_tag(tag: str) -> str:
+    return tag.strip().lower()
+
+
+class SearchIndex:
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_cached_queries: int = 256):
+        self.k1 = k1
+        self.b = b
+        self.max_cached_queries = max_cached_queries
+        # Recent responses, dropped whenever the index changes
+        self._results: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.postings: Dict[str, Dict[str, float]] = {}
+        self.tag_docs: Dict[str, Set[str]] = {}
+        self.status_docs: Dict[str, Set[str]] = {}
+        # Tag counts per status, so status-only filters don't intersect every tag
+        self._status_tags: Dict[str, Counter] = {}
+        # Creation order of each document, for newest-first listings of a subset
+        self._seq: Dict[str, int] = {}
+        self._next_seq = 0
+        # Per-term postings as (-tf / (tf + norm), doc_id), most impactful first.
+        # Built on a term's first broad query and kept sorted as documents change.
+        self._impacts: Dict[str, List[Tuple[float, str]]] = {}
+        # Tag counts of the documents containing a term, kept for terms with large postings
+        self._term_tags: Dict[str, Counter] = {}
+        # Searches may run in worker threads while requests add documents
+        self.lock = threading.RLock()
+        self._lengths: Dict[str, float] = {}
+        self._total_length = 0.0
+        # Per-document BM25 length normalization, k1 * (1 - b + b * length / average).
+        # Recomputed only when the average length drifts, so scoring doesn't redo it.
+        self._norms: Dict[str, float] = {}
+        self._norm_average = 0.0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def add(self, row: Dict[str, Any]):
+        """Index a submission row, replacing any earlier version of it"""
+        with self.lock:
+            self._add(row)
+
+    @staticmethod
+    def document(row: Dict[str, Any]) -> Dict[str, Any]:
+        """The stored fields of a submission row, as kept in ``docs``"""
+        doc = {field: row.get(field) for field in STORED_FIELDS}
+        doc["id"] = str(row["id"])
+        doc["tags"] = [normalize_tag(tag) for tag in (row.get("tags") or []) if tag.strip()]
+        return doc
+
+    def _add(self, row: Dict[str, Any]):
+        doc = self.document(row)
+        doc_id = doc["id"]
+        existing = self.docs.get(doc_id)
+        if existing is not None:
+            # Replaced in place, so an edit doesn't move it in newest-first order
+            self._unindex(doc_id, existing)
+        self._results.clear()
+
+        frequencies: Counter = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            value = " ".join(doc["tags"]) if field == "tags" else (doc.get(field) or "")
+            for term in tokenize(value):
+                frequencies[term] += weight
+        for term, tf in frequencies.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        for tag in set(doc["tags"]):
+            self.tag_docs.setdefault(tag, set()).add(doc_id)
+        self.status_docs.setdefault(doc["status"], set()).add(doc_id)
+        self._status_tags.setdefault(doc["status"], Counter()).update(set(doc["tags"]))
+
+        length = sum(frequencies.values())
+        self._lengths[doc_id] = length
+        self._total_length += length
+        self.docs[doc_id] = doc
+        if existing is None:
+            self._seq[doc_id] = self._next_seq
+            self._next_seq += 1
+        doc_tags = set(doc["tags"])
+        for term in frequencies:
+            term_tags = self._term_tags.get(term)
+            if term_tags is not None:
+                term_tags.update(doc_tags)
+        if self._update_norms(doc_id):
+            self._impacts.clear()
+        else:
+            for term in frequencies:
+                impacts = self._impacts.get(term)
+                if impacts is not None:
+                    bisect.insort(impacts, self._impact(term, doc_id))
+
+    def remove(self, doc_id: str):
+        with self.lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self._seq.pop(doc_id, None)
+        self._unindex(doc_id, doc)
+
+    def _unindex(self, doc_id: str, doc: Dict[str, Any]):
+        """Drop ``doc`` from the postings, tag and status indexes and length totals"""
+        self._results.clear()
+        terms = set()
+        for field in FIELD_WEIGHTS:
+            value = " ".join(doc["tags"]) if field == "tags" else (doc.get(field) or "")
+            terms.update(tokenize(value))
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None or doc_id not in posting:
+                continue
+            impacts = self._impacts.get(term)
+            if impacts is not None:
+                entry = self._impact(term, doc_id)
+                position = bisect.bisect_left(impacts, entry)
+                if position < len(impacts) and impacts[position] == entry:
+                    del impacts[position]
+            term_tags = self._term_tags.get(term)
+            if term_tags is not None:
+                term_tags.subtract(set(doc["tags"]))
+            del posting[doc_id]
+            if not posting:
+                del self.postings[term]
+                self._impacts.pop(term, None)
+                self._term_tags.pop(term, None)
+        status_docs = self.status_docs.get(doc["status"])
+        if status_docs is not None:
+            status_docs.discard(doc_id)
+            if not status_docs:
+                del self.status_docs[doc["status"]]
+        status_tags = self._status_tags.get(doc["status"])
+        if status_tags is not None:
+            status_tags.subtract(set(doc["tags"]))
+            if not status_docs:
+                del self._status_tags[doc["status"]]
+        for tag in set(doc["tags"]):
+            tagged = self.tag_docs.get(tag)
+            if tagged is not None:
+                tagged.discard(doc_id)
+                if not tagged:
+                    del self.tag_docs[tag]
+        self._total_length -= self._lengths.pop(doc_id, 0)
+        self._norms.pop(doc_id, None)
+
+    def _update_norms(self, doc_id: str) -> bool:
+        """Set a new document's norm; True if every norm was recomputed"""
+        average = self._total_length / len(self.docs) if self.docs else 0.0
+        if not self._norm_average or abs(average - self._norm_average) > 0.1 * self._norm_average:
+            self._norm_average = average or 1.0
+            self._norms = {d: self._norm(length) for d, length in self._lengths.items()}
+            return True
+        self._norms[doc_id] = self._norm(self._lengths[doc_id])
+        return False
+
+    def _norm(self, length: float) -> float:
+        return self.k1 * (1 - self.b + self.b * length / self._norm_average)
+
+    def _impact(self, term: str, doc_id: str) -> Tuple[float, str]:
+        tf = self.postings[term][doc_id]
+        return -tf / (tf + self._norms[doc_id]), doc_id
+
+    def _term_tags_for(self, term: str) -> Counter:
+        term_tags = self._term_tags.get(term)
+        if term_tags is None:
+            term_tags = Counter(tag for doc_id in self.postings[term] for tag in self.docs[doc_id]["tags"])
+            if len(self.postings[term]) >= 1000:
+                self._term_tags[term] = term_tags
+        return term_tags
+
+    def _impacts_for(self, term: str) -> List[Tuple[float, str]]:
+        impacts = self._impacts.get(term)
+        if impacts is None:
+            norms = self._norms
+            impacts = self._impacts[term] = sorted(
+                (-tf / (tf + norms[doc_id]), doc_id) for doc_id, tf in self.postings[term].items()
+            )
+        return impacts
+
+    def search(self, query: str = "", tags: Iterable[str] = (), status: Optional[str] = None,
+               limit: int = 20, offset: int = 0, facet_limit: int = 20) -> Dict[str, Any]:
+        """Ranked matches for ``query`` carrying all of ``tags``, with tag facets.
+
+        Without query terms, matches are ordered newest first (documents are
+        indexed in creation order).
+        """
+        tags = frozenset(normalize_tag(tag) for tag in tags)
+        key = (tuple(tokenize(query)), tags, status, limit, offset, facet_limit)
+        with self.lock:
+            response = self._results.get(key)
+            if response is None:
+                response = self._results[key] = self._search(*key)
+                while len(self._results) > self.max_cached_queries:
+                    self._results.popitem(last=False)
+            else:
+                self._results.move_to_end(key)
+            return response
+
+    def _search(self, terms: Tuple[str, ...], tags: FrozenSet[str], status: Optional[str],
+                limit: int, offset: int, facet_limit: int) -> Dict[str, Any]:
+        filters = [self.tag_docs.get(tag, set()) for tag in tags]
+        if status:
+            filters.append(self.status_docs.get(status, set()))
+        candidates: Optional[Set[str]] = None
+        if len(filters) == 1:
+            candidates = filters[0]
+        elif filters:
+            filters.sort(key=len)
+            candidates = filters[0].intersection(*filters[1:])
+
+        count = offset + limit
+        terms = [term for term in dict.fromkeys(terms) if term in self.postings]
+        if terms and candidates is None and len(terms) == 1:
+            # One unfiltered term: the total and facets are kept per term
+            posting = self.postings[terms[0]]
+            top = self._rank(terms, posting.keys(), None, count)
+            total, facets = len(posting), self._top_tags(self._term_tags_for(terms[0]), facet_limit)
+        elif terms:
+            matched: Set[str] = set().union(*(self.postings[term] for term in terms))
+            if candidates is not None:
+                matched &= candidates
+            top = self._rank(terms, matched, candidates, count)
+            total, facets = len(matched), self._facets(matched, facet_limit)
+        else:
+            top = self._newest(candidates, count)
+            total = len(self.docs) if candidates is None else len(candidates)
+            if candidates is None:
+                facets = self._facets(None, facet_limit)
+            elif not tags:
+                facets = self._top_tags(self._status_tags.get(status, Counter()), facet_limit)
+            else:
+                facets = self._facets(candidates, facet_limit)
+        return {
+            "results": [{**self.docs[doc_id], "score": round(score, 4)} for doc_id, score in top[offset:]],
+            "total": total,
+            "facets": {"tags": facets},
+        }
+
+    def _newest(self, candidates: Optional[Set[str]], count: int) -> List[Tuple[str, float]]:
+        if candidates is None:
+            # The newest documents are at the end
+            return [(doc_id, 0.0) for doc_id in itertools.islice(reversed(self.docs), count)]
+        if len(candidates) * 16 < len(self.docs):
+            newest = heapq.nlargest(count, candidates, key=self._seq.__getitem__)
+        else:
+            # A large subset: walking back from the newest finds a page after a few documents
+            newest = list(itertools.islice((d for d in reversed(self.docs) if d in candidates), count))
+        return [(doc_id, 0.0) for doc_id in newest]
+
+    def _rank(self, terms: List[str], matched: Collection[str], allowed: Optional[Set[str]],
+              count: int) -> List[Tuple[str, float]]:
+        """The ``count`` best scored of ``matched``, the documents containing any term within ``allowed``"""
+        n = len(self.docs)
+        weights = {}
+        for term in terms:
+            df = len(self.postings[term])
+            weights[term] = math.log(1 + (n - df + 0.5) / (df + 0.5)) * (self.k1 + 1)
+        if len(matched) <= 4 * count + 256:
+            # Few matches: scoring all of them is cheaper than walking the impact lists
+            ranked = heapq.nlargest(count, ((self._score(doc_id, weights), self._seq[doc_id], doc_id)
+                                            for doc_id in matched))
+        else:
+            ranked = self._threshold_top(weights, allowed, count)
+        return [(doc_id, score) for score, _, doc_id in ranked]
+
+    def _score(self, doc_id: str, weights: Dict[str, float]) -> float:
+        norm = self._norms[doc_id]
+        score = 0.0
+        for term, weight in weights.items():
+            tf = self.postings[term].get(doc_id)
+            if tf:
+                score += weight * tf / (tf + norm)
+        return score
+
+    def _threshold_top(self, weights: Dict[str, float], allowed: Optional[Set[str]],
+                       count: int) -> List[Tuple[float, int, str]]:
+        """Exact top ``count`` by the threshold algorithm over impact-sorted postings.
+
+        Walks every term's impacts in step; a document's full score is taken the
+        first time it is seen, and the walk stops once the ``count``-th best
+        score reaches the best score any unseen document could still have.
+        """
+        lists = [(weight, self._impacts_for(term)) for term, weight in weights.items()]
+        heap: List[Tuple[float, int, str]] = []
+        seen: Set[str] = set()
+        depth = 0
+        while True:
+            threshold = 0.0
+            exhausted = True
+            for weight, impacts in lists:
+                if depth >= len(impacts):
+                    continue
+                exhausted = False
+                impact, doc_id = impacts[depth]
+                threshold -= weight * impact
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                entry = (self._score(doc_id, weights), self._seq[doc_id], doc_id)
+                if len(heap) < count:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+            if exhausted or (len(heap) >= count and heap[0][0] >= threshold):
+                return sorted(heap, reverse=True)
+            depth += 1
+
+    def _facets(self, matches: Optional[Set[str]], limit: int) -> Dict[str, int]:
+        """Tag counts over ``matches``, or over every document when None"""
+        if matches is None or len(matches) == len(self.docs):
+            counts = Counter({tag: len(docs) for tag, docs in self.tag_docs.items()})
+        elif len(self.tag_docs) * 50 < len(matches):
+            # Few distinct tags: set intersections are cheaper than walking every match
+            counts = Counter({tag: len(matches & docs) for tag, docs in self.tag_docs.items()})
+        else:
+            counts = Counter(tag for doc_id in matches for tag in self.docs[doc_id]["tags"])
+        return self._top_tags(counts, limit)
+
+    @staticmethod
+    def _top_tags(counts: Counter, limit: int) -> Dict[str, int]:
+        return dict((+counts).most_common(limit))
+
+
+class SubmissionSearch:
+    """A ``SearchIndex`` kept in sync with the ``submissions`` table.
+
+    ``load_page(since, offset, limit)`` must return every submission row
+    oldest first when ``since`` is None, and otherwise the rows updated at or
+    after ``since`` ordered by ``updated_at``. ``load_deleted(since)`` returns
+    ``submission_deletions`` rows (``id``, ``deleted_at``) deleted at or after
+    ``since``, oldest first. Both are run in a worker thread.
+
+    Building the index is CPU bound and grows with the number of submissions,
+    and every worker builds its own on start. The snapshot saves reading the
+    table again, but the postings are still rebuilt from it.
+    """
+
+    def __init__(self, load_page: Callable[[Optional[str], int, int], List[Dict]],
+                 load_deleted: Callable[[Optional[str]], List[Dict]],
+                 snapshot_path: str = SEARCH_SNAPSHOT_PATH, refresh_interval: float = SEARCH_REFRESH_INTERVAL,
+                 page_size: int = 1000):
+        self.load_page = load_page
+        self.load_deleted = load_deleted
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self.page_size = page_size
+        self.index = SearchIndex()
+        # Newest updated_at and deleted_at read from the database, where catch-up reads resume.
+        # Local adds don't move them, so rows other workers wrote just before them aren't skipped.
+        self.synced_through: Optional[str] = None
+        self.deleted_through: Optional[str] = None
+        # Unix time of the last read of submission_deletions
+        self.deletions_read_at: Optional[float] = None
+        self._dirty = False
+
+    def add(self, row: Dict[str, Any]):
+        self.index.add(row)
+        self._dirty = True
+
+    def search(self, *args, **kwargs) -> Dict[str, Any]:
+        return self.index.search(*args, **kwargs)
+
+    def _documents(self) -> List[Dict[str, Any]]:
+        with self.index.lock:
+            return list(self.index.docs.values())
+
+    async def run(self):
+        """Load the snapshot, then catch up with the table until cancelled"""
+        try:
+            snapshot = await asyncio.to_thread(self.load_snapshot)
+            if snapshot is not None:
+                index, self.synced_through, self.deleted_through, self.deletions_read_at = snapshot
+                # Keep anything indexed while the snapshot was loading
+                for doc in self._documents():
+                    index.add(doc)
+                self.index = index
+        except Exception as e:
+            logger.warning(f"Could not load search snapshot, rebuilding: {e}")
+        while True:
+            try:
+                await self.catch_up()
+                if self._dirty:
+                    self._dirty = False
+                    await asyncio.to_thread(self.save_snapshot, self._documents())
+            except Exception as e:
+                logger.error(f"Search index refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    async def catch_up(self):
+        if self.synced_through is None:
+            await self._load_all()
+        else:
+            await self._load_changes()
+        await self._load_deletions()
+
+    async def _load_all(self):
+        # Rows changed while the pages are read may have been read before the
+        # change, so the first catch-up reads back from before the load started
+        started = (datetime.now(timezone.utc) - timedelta(seconds=SYNC_CLOCK_MARGIN)).isoformat()
+        offset = 0
+        while True:
+            rows = await asyncio.to_thread(self.load_page, None, offset, self.page_size)
+            # Indexing a page takes a while, so it runs off the event loop too
+            await asyncio.to_thread(self._index_page, rows)
+            if len(rows) < self.page_size:
+                break
+            offset += len(rows)
+        self.synced_through = self.deleted_through = started
+
+    async def _load_changes(self):
+        offset = 0
+        while True:
+            since = self.synced_through
+            rows = await asyncio.to_thread(self.load_page, since, offset, self.page_size)
+            await asyncio.to_thread(self._index_page, rows)
+            if rows and rows[-1].get("updated_at"):
+                self.synced_through = rows[-1]["updated_at"]
+            if len(rows) < self.page_size:
+                break
+            # Pages start at the watermark, so a row updated meanwhile only moves
+            # later; only a page entirely at the watermark needs an offset past it
+            offset = offset + len(rows) if self.synced_through == since else 0
+
+    async def _load_deletions(self):
+        read_at = time.time()
+        rows = await asyncio.to_thread(self.load_deleted, self.deleted_through)
+        for row in rows:
+            if str(row["id"]) in self.index.docs:
+                self.index.remove(str(row["id"]))
+                self._dirty = True
+        if rows:
+            self.deleted_through = rows[-1]["deleted_at"]
+        self.deletions_read_at = read_at
+
+    def _index_page(self, rows: List[Dict[str, Any]]):
+        for row in rows:
+            # Rows at the watermark itself are read again, skip those unchanged
+            if self.index.docs.get(str(row["id"])) != SearchIndex.document(row):
+                self.add(row)
+
+    def load_snapshot(self) -> Optional[Tuple[SearchIndex, Optional[str], Optional[str], Optional[float]]]:
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return None
+        with open(self.snapshot_path, "rb") as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            logger.info("Ignoring search snapshot from an older version")
+            return None
+        deletions_read_at = snapshot["deletions_read_at"]
+        if deletions_read_at is None or deletions_read_at < time.time() - SUBMISSION_DELETIONS_RETENTION:
+            # Deletions since then may have been pruned from submission_deletions
+            logger.info("Ignoring search snapshot older than the deletion log")
+            return None
+        index = SearchIndex()
+        for doc in snapshot["docs"]:
+            index.add(doc)
+        logger.info(f"Loaded {len(index)} submissions from search snapshot")
+        return index, snapshot["synced_through"], snapshot["deleted_through"], deletions_read_at
+
+    def save_snapshot(self, docs: List[Dict[str, Any]]):
+        if not self.snapshot_path:
+            return
+        # Only the stored fields are written, the postings are rebuilt on load.
+        # Workers on one host share the snapshot, so each writes its own temporary file.
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(dumps({"version": SNAPSHOT_VERSION, "synced_through": self.synced_through,
+                           "deleted_through": self.deleted_through, "deletions_read_at": self.deletions_read_at,
+                           "docs": docs}))
+        os.replace(tmp_path, self.snapshot_path)
@@ -0,0 +1,63 @@
+"""Fast, compact JSON encoding for REST and WebSocket payloads.
+
+Uses ``orjson`` when it is installed and falls back to the stdlib encoder
+with compact separators otherwise. ``FastJSONResponse`` passes already
+encoded ``bytes`` straight through, so cached bodies are encoded only once.
+"""
+import json
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List
+from uuid import UUID
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def dumps_text(obj: Any) -> str:
+    """Encoded JSON as ``str``, for WebSocket text frames"""
+    return dumps(obj).decode("utf-8")
+
+
+def parse_timestamp(value: str) -> float:
+    """Unix time of a stored timestamp, treating naive values as UTC"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+def omit_fields(rows: Iterable[Dict[str, Any]], fields: Iterable[str]) -> List[Dict[str, Any]]:
+    """Copies of ``rows`` without the given (typically large) fields"""
+    fields = frozenset(fields)
+    return [{k: v for k, v in row.items() if k not in fields} for row in rows]
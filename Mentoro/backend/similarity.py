@@ -0,0 +1,273 @@
+"""Similarity detection for battle submissions.
+
+Submissions are tokenized with Python's own tokenizer, with identifiers,
+numbers and strings normalized so renaming variables doesn't hide a copy.
+Hashed token k-grams are winnowed into a fingerprint set, and a MinHash
+signature of that set is bucketed into an LSH index per problem. A new
+submission is only compared, by exact fingerprint overlap, against the
+submissions sharing an LSH bucket with it rather than every prior one.
+
+Each worker keeps its own indexes and only adds the submissions it checks
+itself, so once an index was last refreshed more than ``SIMILARITY_INDEX_TTL``
+seconds ago the submissions made since its newest one are loaded and added,
+picking up those checked by other workers.
+"""
+import asyncio
+import builtins
+import io
+import keyword
+import logging
+import os
+import random
+import re
+import time
+import tokenize
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from observability import Counter, registry
+from serialization import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Submissions at least this similar to another user's are flagged
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.8"))
+SIMILARITY_INDEX_TTL = float(os.getenv("SIMILARITY_INDEX_TTL", "300"))
+# Refreshes reload this many seconds before an index's newest submission, for
+# submissions stamped by another worker's clock or committed a little late
+REFRESH_OVERLAP = 60
+
+KGRAM = 5
+WINDOW = 4
+NUM_PERM = 64
+BANDS = 16
+# Shorter submissions (e.g. one-liners) are indexed but scored 0, so never flagged
+MIN_FINGERPRINTS = 8
+
+SIMILARITY_CHECKS = registry.register(Counter(
+    "similarity_checks_total",
+    "Battle submissions checked for similarity by outcome (clear, flagged, too_short).",
+    ("result",),
+))
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERM)]
+
+_KEEP_NAMES = frozenset(keyword.kwlist) | frozenset(dir(builtins))
+_SKIPPED_TOKENS = {tokenize.COMMENT, tokenize.NL, tokenize.ENCODING, tokenize.ENDMARKER}
+_FALLBACK_RE = re.compile(r"[A-Za-z_]\w*|\d+(?:\.\d+)?|\S")
+
+
+def _normalize(token_type: int, text: str) -> str:
+    if token_type == tokenize.NAME:
+        return text if text in _KEEP_NAMES else "V"
+    if token_type == tokenize.NUMBER:
+        return "N"
+    if token_type == tokenize.STRING:
+        return "S"
+    return text
+
+
+def code_tokens(code: str) -> List[str]:
+    """Normalized tokens of Python source; code that doesn't tokenize is split on a regex"""
+    try:
+        return [
+            _normalize(token.type, token.string)
+            for token in tokenize.generate_tokens(io.StringIO(code).readline)
+            if token.type not in _SKIPPED_TOKENS
+        ]
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        tokens = []
+        for text in _FALLBACK_RE.findall(code):
+            if text[0].isdigit():
+                tokens.append("N")
+            elif text[0].isalpha() or text[0] == "_":
+                tokens.append(text if text in _KEEP_NAMES else "V")
+            else:
+                tokens.append(text)
+        return tokens
+
+
+def fingerprints(code: str) -> FrozenSet[int]:
+    """Winnowed hashes of the token k-grams of ``code``"""
+    tokens = code_tokens(code)
+    hashes = [zlib.crc32("\x1f".join(tokens[i:i + KGRAM]).encode()) for i in range(len(tokens) - KGRAM + 1)]
+    if len(hashes) <= WINDOW:
+        return frozenset(hashes)
+    selected = set()
+    for start in range(len(hashes) - WINDOW + 1):
+        window = hashes[start:start + WINDOW]
+        selected.add(min(window))
+    return frozenset(selected)
+
+
+def minhash(prints: FrozenSet[int]) -> Tuple[int, ...]:
+    if not prints:
+        return ()
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in prints) for a, b in _PERMUTATIONS)
+
+
+def sketch(code: str) -> Tuple[FrozenSet[int], Tuple[int, ...]]:
+    """Fingerprints of ``code`` and their MinHash signature"""
+    prints = fingerprints(code)
+    return prints, minhash(prints)
+
+
+def jaccard(a: FrozenSet[int], b: FrozenSet[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class SimilarityIndex:
+    """LSH index over the submissions to one problem"""
+
+    def __init__(self, bands: int = BANDS):
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        # doc_id -> (user_id, submitted at, fingerprints, signature)
+        self.docs: Dict[str, Tuple[str, float, FrozenSet[int], Tuple[int, ...]]] = {}
+        self.buckets: List[Dict[Tuple[int, ...], Set[str]]] = [{} for _ in range(bands)]
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def _bands(self, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows]
+
+    def add(self, doc_id: str, user_id: str, submitted: float, prints: FrozenSet[int], signature: Tuple[int, ...]):
+        """Index a submission, replacing an earlier version of ``doc_id``"""
+        self.remove(doc_id)
+        if not prints:
+            return
+        self.docs[doc_id] = (user_id, submitted, prints, signature)
+        for band, key in self._bands(signature):
+            self.buckets[band].setdefault(key, set()).add(doc_id)
+
+    def remove(self, doc_id: str):
+        doc = self.docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for band, key in self._bands(doc[3]):
+            bucket = self.buckets[band][key]
+            bucket.discard(doc_id)
+            if not bucket:
+                del self.buckets[band][key]
+
+    def query(self, user_id: str, before: float, prints: FrozenSet[int],
+              signature: Tuple[int, ...]) -> Tuple[float, Optional[str]]:
+        """Highest similarity to another user's submission made ``before``, and which one it was"""
+        if not prints:
+            return 0.0, None
+        candidates: Set[str] = set()
+        for band, key in self._bands(signature):
+            candidates |= self.buckets[band].get(key, set())
+        best, best_id = 0.0, None
+        for doc_id in candidates:
+            owner, submitted, other, _ = self.docs[doc_id]
+            if owner == user_id or submitted >= before:
+                continue
+            score = jaccard(prints, other)
+            if score > best:
+                best, best_id = score, doc_id
+        return best, best_id
+
+
+class SimilarityChecker:
+    """Checks battle submissions against earlier ones to the same problem.
+
+    ``load_submissions(problem_title, since)`` returns the submitted
+    ``match_participants`` rows (``id``, ``user_id``, ``code_submission``,
+    ``submitted_at``) for a problem, only those submitted at or after the
+    ISO timestamp ``since`` unless it is None, and
+    ``save_score(participant_id, score, similar_to)`` records a result; both
+    run in a worker thread. Indexes are loaded on a problem's first check,
+    refreshed with newer submissions once ``max_age`` seconds old and the
+    least recently checked are evicted past ``max_problems``.
+    """
+
+    def __init__(self, load_submissions: Callable[[str, Optional[str]], List[Dict[str, Any]]],
+                 save_score: Callable[[str, float, Optional[str]], None],
+                 threshold: float = SIMILARITY_THRESHOLD, max_age: float = SIMILARITY_INDEX_TTL,
+                 max_problems: int = 256):
+        self.load_submissions = load_submissions
+        self.save_score = save_score
+        self.threshold = threshold
+        self.max_age = max_age
+        self.max_problems = max_problems
+        # problem_title -> (monotonic time the last refresh started, index,
+        # submitted_at of the newest loaded submission or None)
+        self._indexes: "OrderedDict[str, Tuple[float, SimilarityIndex, Optional[float]]]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Lock] = {}
+
+    def _fresh(self, entry: Optional[Tuple[float, SimilarityIndex, Optional[float]]]) -> bool:
+        return entry is not None and time.monotonic() - entry[0] < self.max_age
+
+    async def _index_for(self, problem_title: str) -> SimilarityIndex:
+        entry = self._indexes.get(problem_title)
+        if not self._fresh(entry):
+            lock = self._loading.setdefault(problem_title, asyncio.Lock())
+            async with lock:
+                entry = self._indexes.get(problem_title)
+                if not self._fresh(entry):
+                    index, newest = (entry[1], entry[2]) if entry is not None else (SimilarityIndex(), None)
+                    started = time.monotonic()
+                    docs, newest = await asyncio.to_thread(self._load, problem_title, index, newest)
+                    # Added here rather than in the thread, as checks may be querying the index
+                    for doc in docs:
+                        index.add(*doc)
+                    entry = self._indexes[problem_title] = (started, index, newest)
+            self._loading.pop(problem_title, None)
+        self._indexes.move_to_end(problem_title)
+        while len(self._indexes) > self.max_problems:
+            self._indexes.popitem(last=False)
+        return entry[1]
+
+    def _load(self, problem_title: str, index: SimilarityIndex, newest: Optional[float]
+              ) -> Tuple[List[Tuple[str, str, float, FrozenSet[int], Tuple[int, ...]]], Optional[float]]:
+        """Sketch the submissions made since ``newest`` that the index doesn't have yet.
+
+        Returns them with the submitted_at of the newest submission loaded so far.
+        """
+        since = None
+        if newest is not None:
+            since = datetime.fromtimestamp(newest - REFRESH_OVERLAP, timezone.utc).isoformat()
+        docs = []
+        for row in self.load_submissions(problem_title, since):
+            if not row.get("code_submission") or not row.get("submitted_at"):
+                continue
+            doc_id, submitted = str(row["id"]), parse_timestamp(row["submitted_at"])
+            newest = submitted if newest is None else max(newest, submitted)
+            known = index.docs.get(doc_id)
+            # Already added, by an earlier load or by checking it here
+            if known is not None and known[1] == submitted:
+                continue
+            docs.append((doc_id, str(row["user_id"]), submitted, *sketch(row["code_submission"])))
+        return docs, newest
+
+    async def check(self, participant_id: str, user_id: str, problem_title: str, code: str,
+                    submitted_at: str) -> Dict[str, Any]:
+        """Score a submission, record the score and add it to its problem's index"""
+        index = await self._index_for(problem_title)
+        submitted = parse_timestamp(submitted_at)
+        prints, signature = await asyncio.to_thread(sketch, code)
+        if len(prints) < MIN_FINGERPRINTS:
+            score, similar_to = 0.0, None
+        else:
+            score, similar_to = index.query(user_id, submitted, prints, signature)
+            score = round(score, 3)
+        await asyncio.to_thread(self.save_score, participant_id, score, similar_to)
+        index.add(participant_id, user_id, submitted, prints, signature)
+
+        if len(prints) < MIN_FINGERPRINTS:
+            SIMILARITY_CHECKS.inc("too_short")
+        elif score >= self.threshold:
+            SIMILARITY_CHECKS.inc("flagged")
+            logger.warning(f"Submission {participant_id} to {problem_title!r} is {score:.0%} similar to {similar_to}")
+        else:
+            SIMILARITY_CHECKS.inc("clear")
+        return {"similarity_score": score, "similar_to": similar_to}
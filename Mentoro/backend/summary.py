@@ -0,0 +1,50 @@
+"""Materialized per-user dashboard summary.
+
+The summary is split into sections (profile, rank, goals, XP, mood), each
+cached per user with its own loader. Write paths either patch a cached
+section in place or invalidate just the sections they affect, so a summary
+request usually costs no queries at all and a miss only reloads what
+changed. Missing sections are loaded concurrently.
+"""
+import asyncio
+from typing import Any, Callable, Dict, Optional
+
+from cache import ReadCache
+
+
+class UserSummaryStore:
+    """Per-user cache of summary sections.
+
+    ``loaders`` maps section names to ``loader(user_id)`` functions, which
+    are run in a worker thread. ``ttl`` bounds how long a section can drift
+    from the database when other users' writes affect it (such as rank) or
+    a write path doesn't update it; ``ttls`` overrides it per section.
+    """
+
+    def __init__(self, loaders: Dict[str, Callable[[str], Any]], ttl: float = 300,
+                 ttls: Optional[Dict[str, float]] = None, max_users: int = 10000):
+        self.loaders = loaders
+        ttls = ttls or {}
+        self.caches = {
+            name: ReadCache(f"summary_{name}", ttls.get(name, ttl), max_entries=max_users)
+            for name in loaders
+        }
+
+    async def get(self, user_id: str) -> Dict[str, Any]:
+        names = list(self.loaders)
+        values = await asyncio.gather(*(
+            self.caches[name].get(user_id, self._loader(name, user_id)) for name in names
+        ))
+        return dict(zip(names, values))
+
+    def _loader(self, name: str, user_id: str):
+        return lambda: asyncio.to_thread(self.loaders[name], user_id)
+
+    def update(self, user_id: str, section: str, func: Callable[[Any], Any]):
+        """Patch a cached section with ``func(value)``, if it is cached"""
+        self.caches[section].update(user_id, func)
+
+    def invalidate(self, user_id: Optional[str], *sections: str):
+        """Drop the given sections (all of them when none are given) of one user, or of everyone"""
+        for name in sections or self.caches:
+            self.caches[name].invalidate(user_id)
@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+from battle_timer import BattleTimer
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Clock:
+    def __init__(self, now: float = 0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Recorder:
+    """Timer callbacks recording (time, event, match_id, seconds left)"""
+
+    def __init__(self, clock: Clock):
+        self.clock = clock
+        self.events = []
+
+    async def on_expire(self, match_id):
+        self.events.append((self.clock.now, "expire", match_id, 0))
+
+    async def on_tick(self, match_id, remaining):
+        self.events.append((self.clock.now, "tick", match_id, remaining))
+
+
+def make_timer(clock: Clock):
+    recorder = Recorder(clock)
+    return BattleTimer(recorder.on_expire, recorder.on_tick, tick_interval=30, final_countdown=10,
+                       clock=clock), recorder
+
+
+async def advance(timer: BattleTimer, clock: Clock, until: float, step: float = 1):
+    """Move the clock forward in steps, firing whatever is due at each one"""
+    while clock.now < until:
+        clock.now += step
+        timer.fire_due()
+        await asyncio.sleep(0)
+
+
+def test_ticks_every_interval_then_counts_down_to_expiry():
+    async def scenario():
+        clock = Clock()
+        timer, recorder = make_timer(clock)
+        timer.schedule("m", started_at=0, time_limit=95)
+        await advance(timer, clock, 100)
+        return recorder.events, len(timer)
+    events, pending = run(scenario())
+    assert events == (
+        [(5, "tick", "m", 90), (35, "tick", "m", 60), (65, "tick", "m", 30), (85, "tick", "m", 10)]
+        + [(95 - n, "tick", "m", n) for n in range(9, 0, -1)]
+        + [(95, "expire", "m", 0)]
+    )
+    assert pending == 0
+
+
+def test_schedule_inside_final_countdown_ticks_every_second():
+    async def scenario():
+        clock = Clock(100)
+        timer, recorder = make_timer(clock)
+        timer.schedule("m", started_at=0, time_limit=105)
+        await advance(timer, clock, 106)
+        return recorder.events
+    assert run(scenario()) == [
+        (101, "tick", "m", 4), (102, "tick", "m", 3), (103, "tick", "m", 2), (104, "tick", "m", 1),
+        (105, "expire", "m", 0),
+    ]
+
+
+def test_deadline_passed_while_down_expires_immediately():
+    async def scenario():
+        clock = Clock(2000)
+        timer, recorder = make_timer(clock)
+        # Recovered on startup long after its deadline
+        timer.schedule("m", started_at=0, time_limit=1800)
+        timer.fire_due()
+        await asyncio.sleep(0)
+        return recorder.events, len(timer)
+    assert run(scenario()) == ([(2000, "expire", "m", 0)], 0)
+
+
+def test_cancel_stops_ticks_and_expiry():
+    async def scenario():
+        clock = Clock()
+        timer, recorder = make_timer(clock)
+        timer.schedule("a", started_at=0, time_limit=60)
+        timer.schedule("b", started_at=0, time_limit=60)
+        timer.cancel("a")
+        await advance(timer, clock, 70)
+        return {match_id for _, _, match_id, _ in recorder.events}, timer.remaining("a")
+    assert run(scenario()) == ({"b"}, None)
+
+
+def test_rescheduling_supersedes_the_earlier_deadline():
+    async def scenario():
+        clock = Clock()
+        timer, recorder = make_timer(clock)
+        timer.schedule("m", started_at=0, time_limit=20)
+        timer.schedule("m", started_at=0, time_limit=40)
+        await advance(timer, clock, 50)
+        return [(when, event) for when, event, _, _ in recorder.events if event == "expire"]
+    assert run(scenario()) == [(40, "expire")]
+
+
+def test_elapsed_and_remaining_follow_the_clock():
+    clock = Clock(10)
+    timer, _ = make_timer(clock)
+    timer.schedule("m", started_at=0, time_limit=60)
+    clock.now = 25
+    assert timer.elapsed("m") == 25
+    assert timer.remaining("m") == 35
+    clock.now = 90
+    assert timer.remaining("m") == 0
+    assert timer.elapsed("missing") is None
+
+
+def test_run_wakes_for_an_earlier_deadline():
+    async def scenario():
+        expired = []
+
+        async def on_expire(match_id):
+            expired.append(match_id)
+
+        async def on_tick(match_id, remaining):
+            pass
+
+        timer = BattleTimer(on_expire, on_tick)
+        task = asyncio.create_task(timer.run())
+        timer.schedule("late", started_at=time.time(), time_limit=3600)
+        await asyncio.sleep(0.01)
+        # Scheduled while run() sleeps until the later match's first tick
+        timer.schedule("soon", started_at=time.time(), time_limit=0.05)
+        await asyncio.sleep(0.3)
+        task.cancel()
+        return expired
+    assert run(scenario()) == ["soon"]
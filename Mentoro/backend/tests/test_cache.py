@@ -0,0 +1,118 @@
+import asyncio
+
+from cache import ReadCache
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Loader:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.calls = []
+
+    def __call__(self, value):
+        async def load():
+            self.calls.append(value)
+            await asyncio.sleep(self.delay)
+            return value
+        return load
+
+
+def test_hit_within_ttl():
+    async def scenario():
+        cache, loader = ReadCache("test", ttl=60), Loader()
+        assert await cache.get("k", loader(1)) == 1
+        assert await cache.get("k", loader(2)) == 1
+        return loader.calls
+    assert run(scenario()) == [1]
+
+
+def test_concurrent_gets_share_one_load():
+    async def scenario():
+        cache, loader = ReadCache("test", ttl=60), Loader(delay=0.01)
+        values = await asyncio.gather(*(cache.get("k", loader(i)) for i in range(5)))
+        return values, loader.calls
+    values, calls = run(scenario())
+    assert values == [0] * 5
+    assert calls == [0]
+
+
+def test_invalidate_key_drops_value():
+    async def scenario():
+        cache, loader = ReadCache("test", ttl=60), Loader()
+        await cache.get("k", loader(1))
+        cache.invalidate("k")
+        return await cache.get("k", loader(2))
+    assert run(scenario()) == 2
+
+
+def test_invalidate_key_discards_its_inflight_load():
+    async def scenario():
+        cache, loader = ReadCache("test", ttl=60), Loader(delay=0.02)
+        pending = asyncio.create_task(cache.get("k", loader("old")))
+        await asyncio.sleep(0)
+        cache.invalidate("k")
+        # The caller that started the load still gets its result...
+        assert await pending == "old"
+        # ...but it is not cached
+        return await cache.get("k", loader("new"))
+    assert run(scenario()) == "new"
+
+
+def test_invalidate_key_leaves_other_inflight_loads():
+    async def scenario():
+        cache, loader = ReadCache("test", ttl=60), Loader(delay=0.02)
+        a = asyncio.create_task(cache.get("a", loader("a1")))
+        b = asyncio.create_task(cache.get("b", loader("b1")))
+        await asyncio.sleep(0)
+        cache.invalidate("a")
+        await asyncio.gather(a, b)
+        return await cache.get("b", loader("b2")), loader.calls
+    value, calls = run(scenario())
+    assert value == "b1"
+    assert calls == ["a1", "b1"]
+
+
+def test_invalidate_all_discards_every_inflight_load():
+    async def scenario():
+        cache, loader = ReadCache("test", ttl=60), Loader(delay=0.02)
+        await cache.get("cached", loader("c1"))
+        a = asyncio.create_task(cache.get("a", loader("a1")))
+        await asyncio.sleep(0)
+        cache.invalidate()
+        await a
+        return await cache.get("a", loader("a2")), await cache.get("cached", loader("c2"))
+    assert run(scenario()) == ("a2", "c2")
+
+
+def test_update_patches_cached_value():
+    async def scenario():
+        cache, loader = ReadCache("test", ttl=60), Loader()
+        await cache.get("k", loader(1))
+        cache.update("k", lambda v: v + 10)
+        cache.update("missing", lambda v: v + 10)
+        return await cache.get("k", loader(2)), await cache.get("missing", loader(3))
+    assert run(scenario()) == (11, 3)
+
+
+def test_update_during_load_invalidates():
+    async def scenario():
+        cache, loader = ReadCache("test", ttl=60), Loader(delay=0.02)
+        pending = asyncio.create_task(cache.get("k", loader(1)))
+        await asyncio.sleep(0)
+        cache.update("k", lambda v: v + 10)
+        await pending
+        return await cache.get("k", loader(2))
+    assert run(scenario()) == 2
+
+
+def test_stale_value_served_while_refreshing():
+    async def scenario():
+        cache, loader = ReadCache("test", ttl=0, stale_ttl=60), Loader(delay=0.01)
+        await cache.get("k", loader(1))
+        stale = await cache.get("k", loader(2))
+        await asyncio.sleep(0.05)
+        return stale, cache._entries["k"][0]
+    assert run(scenario()) == (1, 2)
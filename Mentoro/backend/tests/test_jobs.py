@@ -0,0 +1,192 @@
+import asyncio
+
+import pytest
+
+from jobs import JobQueue
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Clock:
+    def __init__(self, now: float = 1000):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_queue(clock: Clock, **kwargs) -> JobQueue:
+    options = {"max_attempts": 3, "timeout": 5, "base_backoff": 10, "max_backoff": 100}
+    options.update(kwargs)
+    return JobQueue(":memory:", clock=clock, **options)
+
+
+class Flaky:
+    """Handler failing its first ``failures`` calls"""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = []
+
+    async def __call__(self, payload):
+        self.calls.append(payload)
+        if len(self.calls) <= self.failures:
+            raise RuntimeError(f"failure {len(self.calls)}")
+        return {"done": payload["n"]}
+
+
+def test_idempotency_key_creates_one_job():
+    async def scenario():
+        queue = make_queue(Clock())
+        queue.handler("work")(Flaky())
+        first = await queue.enqueue("work", {"n": 1}, idempotency_key="k")
+        again = await queue.enqueue("work", {"n": 2}, idempotency_key="k")
+        other = await queue.enqueue("work", {"n": 3}, idempotency_key="other")
+        unkeyed = [await queue.enqueue("work", {"n": 4}) for _ in range(2)]
+        return first, again, other, unkeyed
+    first, again, other, unkeyed = run(scenario())
+    assert again["id"] == first["id"]
+    assert other["id"] != first["id"]
+    assert unkeyed[0]["id"] != unkeyed[1]["id"]
+
+
+def test_enqueue_rejects_unknown_kind():
+    async def scenario():
+        await make_queue(Clock()).enqueue("missing", {})
+    with pytest.raises(ValueError):
+        run(scenario())
+
+
+def test_success_stores_result():
+    async def scenario():
+        queue = make_queue(Clock())
+        queue.handler("work")(Flaky())
+        job = await queue.enqueue("work", {"n": 7}, user_id="u")
+        assert await queue.run_next()
+        assert not await queue.run_next()
+        return await queue.get(job["id"])
+    job = run(scenario())
+    assert job["status"] == "succeeded"
+    assert job["attempts"] == 1
+    assert job["result"] == {"done": 7}
+    assert job["user_id"] == "u"
+
+
+def test_failures_back_off_exponentially_then_succeed():
+    async def scenario():
+        clock = Clock()
+        queue = make_queue(clock)
+        handler = queue.handler("work")(Flaky(failures=2))
+        job = await queue.enqueue("work", {"n": 1})
+        start = clock.now
+
+        assert await queue.run_next()
+        retried = await queue.get(job["id"])
+        # The first retry waits between half and all of base_backoff
+        clock.now = start + 4.9
+        assert not await queue.run_next()
+        clock.now = start + 10
+        assert await queue.run_next()
+
+        # The second waits twice as long
+        start = clock.now
+        clock.now = start + 9.9
+        assert not await queue.run_next()
+        clock.now = start + 20
+        assert await queue.run_next()
+        return retried, await queue.get(job["id"]), len(handler.calls)
+    retried, done, calls = run(scenario())
+    assert retried["status"] == "queued"
+    assert retried["error"] == "RuntimeError: failure 1"
+    assert done["status"] == "succeeded"
+    assert done["attempts"] == 3
+    assert done["error"] is None
+    assert calls == 3
+
+
+def test_fails_after_max_attempts():
+    async def scenario():
+        clock = Clock()
+        queue = make_queue(clock)
+        handler = queue.handler("work")(Flaky(failures=10))
+        job = await queue.enqueue("work", {"n": 1})
+        for _ in range(10):
+            await queue.run_next()
+            # Past any backoff
+            clock.now += 50
+        return await queue.get(job["id"]), len(handler.calls)
+    job, calls = run(scenario())
+    assert job["status"] == "failed"
+    assert job["attempts"] == 3
+    assert job["error"] == "RuntimeError: failure 3"
+    assert calls == 3
+
+
+def test_timed_out_run_is_retried():
+    async def scenario():
+        queue = make_queue(Clock(), timeout=0.01)
+
+        @queue.handler("slow")
+        async def slow(payload):
+            await asyncio.sleep(1)
+
+        job = await queue.enqueue("slow", {})
+        await queue.run_next()
+        return await queue.get(job["id"])
+    job = run(scenario())
+    assert job["status"] == "queued"
+    assert job["error"].startswith("TimeoutError")
+
+
+def test_job_is_reclaimed_once_its_lease_expires():
+    async def scenario():
+        clock = Clock()
+        queue = make_queue(clock)
+        release = asyncio.Event()
+        calls = []
+
+        @queue.handler("work")
+        async def work(payload):
+            calls.append(clock.now)
+            if len(calls) == 1:
+                # The first worker stalls, as if it had died
+                await release.wait()
+            return len(calls)
+
+        job = await queue.enqueue("work", {})
+        stalled = asyncio.create_task(queue.run_next())
+        while not calls:
+            await asyncio.sleep(0.01)
+        leased = await queue.get(job["id"])
+        # Still leased to the first worker
+        assert not await queue.run_next()
+        clock.now += queue.timeout + 31
+        assert await queue.run_next()
+        release.set()
+        await stalled
+        return leased, await queue.get(job["id"]), len(calls)
+    leased, job, calls = run(scenario())
+    assert leased["status"] == "running"
+    assert calls == 2
+    assert job["attempts"] == 2
+    assert job["status"] == "succeeded"
+
+
+def test_workers_wake_for_new_jobs():
+    async def scenario():
+        queue = JobQueue(":memory:", concurrency=1, poll_interval=30)
+        done = asyncio.Event()
+
+        @queue.handler("work")
+        async def work(payload):
+            done.set()
+
+        workers = asyncio.create_task(queue.run())
+        await asyncio.sleep(0.05)
+        # Workers are idle for poll_interval, so only the wake-up gets this run promptly
+        await queue.enqueue("work", {})
+        await asyncio.wait_for(done.wait(), 2)
+        workers.cancel()
+    run(scenario())
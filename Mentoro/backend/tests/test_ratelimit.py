@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+import ratelimit
+from ratelimit import MemoryBucketStore, RateLimit, RateLimiter, parse_limits
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+def take(store, limit, key="user"):
+    return asyncio.run(store.take(key, limit))
+
+
+def test_burst_up_to_capacity(clock):
+    store, limit = MemoryBucketStore(), RateLimit(rate=1, capacity=3)
+    assert [take(store, limit) for _ in range(3)] == [0, 0, 0]
+    assert take(store, limit) == pytest.approx(1)
+
+
+def test_refill_over_time(clock):
+    store, limit = MemoryBucketStore(), RateLimit(rate=0.5, capacity=2)
+    take(store, limit)
+    take(store, limit)
+    clock.now += 1
+    # Half a token refilled: the next one is 1s away
+    assert take(store, limit) == pytest.approx(1)
+    clock.now += 1
+    assert take(store, limit) == 0
+
+
+def test_refill_capped_at_capacity(clock):
+    store, limit = MemoryBucketStore(), RateLimit(rate=1, capacity=2)
+    take(store, limit)
+    clock.now += 100
+    assert [take(store, limit) for _ in range(2)] == [0, 0]
+    assert take(store, limit) == pytest.approx(1)
+
+
+def test_rejected_request_consumes_nothing(clock):
+    store, limit = MemoryBucketStore(), RateLimit(rate=1, capacity=1)
+    take(store, limit)
+    clock.now += 0.25
+    assert take(store, limit) == pytest.approx(0.75)
+    assert take(store, limit) == pytest.approx(0.75)
+
+
+def test_keys_are_independent(clock):
+    store, limit = MemoryBucketStore(), RateLimit(rate=1, capacity=1)
+    assert take(store, limit, "a") == 0
+    assert take(store, limit, "b") == 0
+    assert take(store, limit, "a") > 0
+
+
+def test_evicted_bucket_starts_full(clock):
+    store, limit = MemoryBucketStore(max_keys=1), RateLimit(rate=1, capacity=1)
+    take(store, limit, "a")
+    take(store, limit, "b")
+    assert take(store, limit, "a") == 0
+
+
+def test_parse_limits():
+    limits = parse_limits("llm=10/60:3, xp=30/60,write=0")
+    assert limits["llm"] == RateLimit(pytest.approx(10 / 60), 3)
+    assert limits["xp"] == RateLimit(pytest.approx(0.5), 30)
+    assert limits["write"].rate == 0
+
+
+def test_disabled_and_unknown_classes_allow(clock):
+    limiter = RateLimiter({"write": RateLimit(0, 0)})
+    assert asyncio.run(limiter.check("write", "user")) == 0
+    assert asyncio.run(limiter.check("unknown", "user")) == 0
+
+
+def test_store_errors_fail_open():
+    class BrokenStore:
+        async def take(self, key, limit, cost=1):
+            raise ConnectionError("down")
+
+    limiter = RateLimiter({"write": RateLimit(1, 1)}, BrokenStore())
+    assert asyncio.run(limiter.check("write", "user")) == 0
+
+
+@pytest.mark.parametrize("seconds, header", [(0.1, "1"), (1.0, "1"), (1.2, "2"), (59.5, "60")])
+def test_retry_after_header_rounds_up(seconds, header):
+    assert RateLimiter.retry_after_header(seconds) == {"Retry-After": header}
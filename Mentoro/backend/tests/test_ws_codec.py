@@ -0,0 +1,47 @@
+import zlib
+
+import pytest
+
+from ws_codec import FLAG_COMPRESSED, PROTOCOL_VERSION, BinaryJSONCodec
+
+HEADER = bytes([(PROTOCOL_VERSION << 4) | FLAG_COMPRESSED])
+
+
+def test_round_trip_compresses_large_messages():
+    codec = BinaryJSONCodec("mentoro.v1.json", threshold=64)
+    message = {"type": "code_sync", "code": "print('hello')\n" * 100}
+    frame = codec.encode(message)
+    assert frame[0] & FLAG_COMPRESSED
+    assert codec.decode(frame) == message
+
+
+def test_small_messages_are_not_compressed():
+    codec = BinaryJSONCodec("mentoro.v1.json", threshold=64)
+    frame = codec.encode({"type": "pong"})
+    assert not frame[0] & FLAG_COMPRESSED
+    assert codec.decode(frame) == {"type": "pong"}
+
+
+def test_decodes_frame_inflating_to_exactly_the_limit():
+    payload = b'{"code":"' + b"a" * 1000 + b'"}'
+    codec = BinaryJSONCodec("mentoro.v1.json", max_decoded=len(payload))
+    assert codec.decode(HEADER + zlib.compress(payload)) == {"code": "a" * 1000}
+
+
+def test_rejects_frame_inflating_past_the_limit():
+    codec = BinaryJSONCodec("mentoro.v1.json", max_decoded=1024)
+    with pytest.raises(ValueError, match="inflates"):
+        codec.decode(HEADER + zlib.compress(b'{"code":"' + b"a" * 2000 + b'"}'))
+
+
+def test_rejects_decompression_bomb_at_default_limit():
+    # ~64 KB of compressed zeros inflating to 64 MiB
+    deflater = zlib.compressobj(9)
+    bomb = b"".join(deflater.compress(b"0" * 1024 * 1024) for _ in range(64)) + deflater.flush()
+    with pytest.raises(ValueError, match="inflates"):
+        BinaryJSONCodec("mentoro.v1.json").decode(HEADER + bomb)
+
+
+def test_rejects_unknown_protocol_version():
+    with pytest.raises(ValueError, match="version"):
+        BinaryJSONCodec("mentoro.v1.json").decode(bytes([(PROTOCOL_VERSION + 1) << 4]) + b"{}")
@@ -0,0 +1,130 @@
+"""WebSocket message codecs.
+
+Clients pick an encoding through the WebSocket subprotocol they offer:
+
+* no subprotocol: JSON text frames, as sent by the web client
+* ``mentoro.v1.json``: binary frames carrying compact JSON
+* ``mentoro.v1.msgpack``: binary frames carrying MessagePack (needs the
+  optional ``msgpack`` package)
+
+Binary frames start with one header byte: the protocol version in the high
+nibble and flags in the low nibble. Payloads of at least
+``WS_COMPRESSION_THRESHOLD`` bytes are zlib-compressed when that makes them
+smaller, so small, latency-sensitive messages are never compressed.
+Compressed frames from clients may inflate to at most
+``WS_MAX_MESSAGE_SIZE`` bytes, the limit the server puts on raw frames.
+Permessage-deflate for text frames is negotiated by the server itself.
+"""
+import json
+import os
+import zlib
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Union
+
+from serialization import dumps, dumps_text
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+PROTOCOL_VERSION = 1
+FLAG_COMPRESSED = 0x1
+
+WS_COMPRESSION_THRESHOLD = int(os.getenv("WS_COMPRESSION_THRESHOLD", "1024"))
+WS_COMPRESSION_LEVEL = int(os.getenv("WS_COMPRESSION_LEVEL", "6"))
+# Defaults to uvicorn's own ws_max_size
+WS_MAX_MESSAGE_SIZE = int(os.getenv("WS_MAX_MESSAGE_SIZE", str(16 * 1024 * 1024)))
+
+
+class TextJSONCodec:
+    name = "json"
+    binary = False
+
+    def encode(self, message: Dict[str, Any]) -> str:
+        return dumps_text(message)
+
+    def decode(self, data: Union[str, bytes]) -> Dict[str, Any]:
+        return json.loads(data)
+
+
+class BinaryCodec(ABC):
+    binary = True
+
+    def __init__(self, name: str, threshold: int = WS_COMPRESSION_THRESHOLD,
+                 level: int = WS_COMPRESSION_LEVEL, max_decoded: int = WS_MAX_MESSAGE_SIZE):
+        self.name = name
+        self.threshold = threshold
+        self.level = level
+        self.max_decoded = max_decoded
+
+    @abstractmethod
+    def serialize(self, message: Dict[str, Any]) -> bytes:
+        ...
+
+    @abstractmethod
+    def deserialize(self, payload: bytes) -> Dict[str, Any]:
+        ...
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        payload = self.serialize(message)
+        flags = 0
+        if len(payload) >= self.threshold:
+            compressed = zlib.compress(payload, self.level)
+            if len(compressed) < len(payload):
+                payload, flags = compressed, FLAG_COMPRESSED
+        return bytes([(PROTOCOL_VERSION << 4) | flags]) + payload
+
+    def decode(self, data: Union[str, bytes]) -> Dict[str, Any]:
+        if isinstance(data, str):
+            # Tolerate text frames from clients that mix encodings
+            return json.loads(data)
+        if not data:
+            raise ValueError("Empty frame")
+        version, flags = data[0] >> 4, data[0] & 0x0F
+        if version != PROTOCOL_VERSION:
+            raise ValueError(f"Unsupported protocol version {version}")
+        payload = data[1:]
+        if flags & FLAG_COMPRESSED:
+            # Bounded, so a small compressed frame can't inflate without limit
+            inflater = zlib.decompressobj()
+            payload = inflater.decompress(payload, self.max_decoded)
+            if inflater.unconsumed_tail:
+                raise ValueError(f"Frame inflates to more than {self.max_decoded} bytes")
+        return self.deserialize(payload)
+
+
+class BinaryJSONCodec(BinaryCodec):
+    def serialize(self, message: Dict[str, Any]) -> bytes:
+        return dumps(message)
+
+    def deserialize(self, payload: bytes) -> Dict[str, Any]:
+        return json.loads(payload)
+
+
+class MessagePackCodec(BinaryCodec):
+    def serialize(self, message: Dict[str, Any]) -> bytes:
+        return msgpack.packb(message, default=str)
+
+    def deserialize(self, payload: bytes) -> Dict[str, Any]:
+        return msgpack.unpackb(payload)
+
+
+DEFAULT_CODEC = TextJSONCodec()
+
+# Offered subprotocols in server preference order
+CODECS: Dict[str, Any] = {"mentoro.v1.json": BinaryJSONCodec("mentoro.v1.json")}
+if msgpack is not None:
+    CODECS = {"mentoro.v1.msgpack": MessagePackCodec("mentoro.v1.msgpack"), **CODECS}
+
+
+def negotiate(offered: List[str]) -> Optional[str]:
+    """Pick the subprotocol to accept from those a client offered"""
+    for name in CODECS:
+        if name in offered:
+            return name
+    return None
+
+
+def codec_for(subprotocol: Optional[str]):
+    return CODECS.get(subprotocol, DEFAULT_CODEC) if subprotocol else DEFAULT_CODEC
@@ -30,6 +30,11 @@ export const useWebSocket = () => {
       ws.current.onmessage = (event) => {
         try {
           const message = JSON.parse(event.data);
+          if (message.type === 'ping') {
+            // Answer heartbeats so the server doesn't close the connection as idle
+            ws.current?.send(JSON.stringify({ type: 'pong' }));
+            return;
+          }
           setMessages(prev => [...prev, message]);
         } catch (error) {
           console.error('Error parsing WebSocket message:', error);
@@ -0,0 +1,15 @@
+/*
+  # Battle submission similarity
+
+  1. Changes
+    - `match_participants.similarity_score` - Highest similarity (0-1) of the
+      submission to another user's earlier submission to the same problem
+    - `match_participants.similar_to` - The participant row it was most similar to
+    - Index on `matches.problem_title` to load a problem's submissions
+*/
+
+ALTER TABLE match_participants
+  ADD COLUMN IF NOT EXISTS similarity_score real,
+  ADD COLUMN IF NOT EXISTS similar_to uuid REFERENCES match_participants(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_matches_problem_title ON matches(problem_title);
@@ -0,0 +1,22 @@
+/*
+  # Atomic daily goal progress
+
+  1. Functions
+    - `increment_goal_progress(goal_ids, amounts)` - Adds `amounts[i]` to the
+      progress of goal `goal_ids[i]` if it is not completed yet, capped at its
+      target, and returns the updated rows. Backend workers each batch their
+      own increments, so progress has to be added in the database rather than
+      written as an absolute value, and a batch is one statement so it is
+      applied completely or not at all.
+*/
+
+CREATE OR REPLACE FUNCTION increment_goal_progress(goal_ids uuid[], amounts integer[])
+RETURNS SETOF daily_goals
+LANGUAGE sql
+AS $$
+  UPDATE daily_goals
+  SET current = LEAST(daily_goals.target, daily_goals.current + increments.amount)
+  FROM unnest(goal_ids, amounts) AS increments(goal_id, amount)
+  WHERE daily_goals.id = increments.goal_id AND NOT daily_goals.completed
+  RETURNING daily_goals.*;
+$$;
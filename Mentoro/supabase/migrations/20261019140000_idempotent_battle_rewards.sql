@@ -0,0 +1,86 @@
+/*
+  # Idempotent XP awards and battle stats
+
+  1. Changes
+    - `xp_logs.idempotency_key` - Optional unique key of an award, e.g.
+      `battle_xp:<match id>`; an award with a key already logged is skipped.
+    - `matches.stats_recorded` - Whether the winner's battle stats have been
+      counted for the match.
+
+  2. Functions
+    - `award_xp(user_id, amount, source, description, idempotency_key)` - Logs
+      XP and adds it to the profile in one transaction, at most once per key.
+      Returns the resulting `xp`, `total_xp` and `level`, the new log row (null
+      if the key was already used) and whether the award was applied.
+    - `record_battle_win(match_id, user_id)` - Adds a battle and a win to the
+      winner's profile once per match and returns whether it did.
+
+  Both are called from retried background jobs, so a retry after a partial
+  run or a lost lease must not reward the winner twice.
+*/
+
+ALTER TABLE xp_logs ADD COLUMN IF NOT EXISTS idempotency_key text UNIQUE;
+ALTER TABLE matches ADD COLUMN IF NOT EXISTS stats_recorded boolean NOT NULL DEFAULT false;
+
+CREATE OR REPLACE FUNCTION award_xp(
+  user_id uuid,
+  amount integer,
+  source text,
+  description text DEFAULT NULL,
+  idempotency_key text DEFAULT NULL
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  log_row xp_logs;
+  profile_row profiles;
+BEGIN
+  INSERT INTO xp_logs (user_id, amount, source, description, idempotency_key)
+  VALUES (award_xp.user_id, award_xp.amount, award_xp.source, award_xp.description, award_xp.idempotency_key)
+  ON CONFLICT ON CONSTRAINT xp_logs_idempotency_key_key DO NOTHING
+  RETURNING * INTO log_row;
+
+  IF log_row.id IS NULL THEN
+    SELECT * INTO profile_row FROM profiles WHERE id = award_xp.user_id;
+  ELSE
+    UPDATE profiles
+    SET xp = xp + award_xp.amount,
+        total_xp = total_xp + award_xp.amount,
+        level = GREATEST(1, (total_xp + award_xp.amount) / 1000 + 1)
+    WHERE id = award_xp.user_id
+    RETURNING * INTO profile_row;
+  END IF;
+
+  IF profile_row.id IS NULL THEN
+    RAISE EXCEPTION 'Profile % not found', award_xp.user_id;
+  END IF;
+
+  RETURN jsonb_build_object(
+    'applied', log_row.id IS NOT NULL,
+    'log', CASE WHEN log_row.id IS NULL THEN NULL ELSE to_jsonb(log_row) END,
+    'xp', profile_row.xp,
+    'total_xp', profile_row.total_xp,
+    'level', profile_row.level
+  );
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION record_battle_win(match_id uuid, user_id uuid)
+RETURNS boolean
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  UPDATE matches SET stats_recorded = true
+  WHERE id = record_battle_win.match_id AND NOT stats_recorded;
+  IF NOT FOUND THEN
+    RETURN false;
+  END IF;
+
+  UPDATE profiles
+  SET total_battles = total_battles + 1,
+      battles_won = battles_won + 1
+  WHERE id = record_battle_win.user_id;
+  RETURN true;
+END;
+$$;
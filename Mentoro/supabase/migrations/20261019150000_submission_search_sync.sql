@@ -0,0 +1,48 @@
+/*
+  # Submission changes for the search index
+
+  1. Changes
+    - `submissions.updated_at` - Kept current by the existing
+      `update_updated_at_column()` trigger, so backend workers can catch their
+      search index up with edited and re-reviewed submissions. Existing rows
+      start at their review or creation time.
+
+  2. New Tables
+    - `submission_deletions` - Ids of deleted submissions and when they were
+      deleted, recorded by a trigger so deletions reach the index as well.
+      Entries older than 30 days are pruned whenever one is recorded.
+
+  3. Security
+    - Enable RLS on `submission_deletions`; like `submissions`, everyone can
+      read it.
+*/
+
+ALTER TABLE submissions ADD COLUMN IF NOT EXISTS updated_at timestamptz DEFAULT now();
+UPDATE submissions SET updated_at = COALESCE(reviewed_at, created_at);
+CREATE INDEX IF NOT EXISTS submissions_updated_at_idx ON submissions (updated_at);
+
+CREATE TRIGGER update_submissions_updated_at BEFORE UPDATE ON submissions FOR EACH ROW EXECUTE PROCEDURE update_updated_at_column();
+
+CREATE TABLE IF NOT EXISTS submission_deletions (
+  id uuid PRIMARY KEY,
+  deleted_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS submission_deletions_deleted_at_idx ON submission_deletions (deleted_at);
+
+ALTER TABLE submission_deletions ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "Everyone can view submission deletions" ON submission_deletions FOR SELECT USING (true);
+
+-- Runs as its owner, since whoever deletes a submission can't write to the log directly
+CREATE OR REPLACE FUNCTION record_submission_deletion()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  INSERT INTO submission_deletions (id) VALUES (OLD.id) ON CONFLICT (id) DO NOTHING;
+  DELETE FROM submission_deletions WHERE deleted_at < now() - interval '30 days';
+  RETURN OLD;
+END;
+$$;
+
+CREATE TRIGGER record_submission_deletion AFTER DELETE ON submissions FOR EACH ROW EXECUTE PROCEDURE record_submission_deletion();
@@ -0,0 +1,33 @@
+/*
+  # Incremental loading of a problem's submissions
+
+  1. Functions
+    - `problem_submissions(title, since)` - The submitted `match_participants`
+      rows of matches for problem `title`, oldest first, only those submitted
+      at or after `since` when it is given. Backend workers keep a similarity
+      index per problem and refresh it with what was submitted since their
+      last load, which needs the join in the database rather than a growing
+      list of match ids in the request.
+
+  2. Indexes
+    - `match_participants (match_id, submitted_at)` for the join and the
+      `since` filter
+*/
+
+CREATE INDEX IF NOT EXISTS idx_match_participants_match_submitted
+  ON match_participants(match_id, submitted_at);
+
+CREATE OR REPLACE FUNCTION problem_submissions(title text, since timestamptz DEFAULT NULL)
+RETURNS TABLE (id uuid, user_id uuid, code_submission text, submitted_at timestamptz)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT p.id, p.user_id, p.code_submission, p.submitted_at
+  FROM match_participants p
+  JOIN matches m ON m.id = p.match_id
+  WHERE m.problem_title = title
+    AND p.code_submission IS NOT NULL
+    AND p.submitted_at IS NOT NULL
+    AND (since IS NULL OR p.submitted_at >= since)
+  ORDER BY p.submitted_at;
+$$;